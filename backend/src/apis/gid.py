@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import json
 import os
 import sys
 import time
@@ -7,10 +8,12 @@ import time
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from common.logger import get_logger
+from common.text import query_embedding_cache
 from controller.agent import Agent
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
 from flask_cors import CORS
 from infrastructure.controller_service import controller_service
+from infrastructure.worker_pool import llm_pool
 
 app = Flask(__name__)
 CORS(app)
@@ -55,9 +58,30 @@ def initialize_controller():
 initialize_controller()
 
 
+def get_session_id(data: dict | None = None) -> str | None:
+    """Session id từ body JSON, header X-Session-Id hoặc query string."""
+    if data and data.get("session_id"):
+        return str(data["session_id"])
+    return request.headers.get("X-Session-Id") or request.args.get("session_id")
+
+
+def get_pagination() -> tuple[int, int | None]:
+    offset = max(0, request.args.get("offset", 0, type=int))
+    limit = request.args.get("limit", None, type=int)
+    return offset, limit
+
+
 @app.route("/health", methods=["GET"])
 def health_check():
-    return jsonify({"status": "healthy" if is_ready else "initializing"})
+    return jsonify(
+        {
+            "status": "healthy" if is_ready else "initializing",
+            "embedding_cache": query_embedding_cache.stats(),
+            "answer_cache": controller.answer_cache.stats() if controller else None,
+            "sessions": controller.sessions.stats() if controller else None,
+            "llm_pool": llm_pool.stats(),
+        }
+    )
 
 
 @app.route("/get_message", methods=["POST"])
@@ -68,14 +92,25 @@ def chat():
             return jsonify({"error": "Prompt is required"}), 400
 
         prompt = data["input"]
+        session_id = get_session_id(data)
 
         # Sử dụng event loop có sẵn thay vì tạo mới
         try:
             start = time.time()
 
-            result = agent.execute(prompt)
-            full_query = result.text if hasattr(result, "text") else str(result)
-            response_text = controller.get_llm_response(full_query)
+            with controller.session(session_id):
+                cached_answer = controller.get_cached_answer(prompt, session_id)
+                if cached_answer is not None:
+                    return jsonify(
+                        {
+                            "response": cached_answer,
+                            "time": time.time() - start,
+                            "cached": True,
+                            "status": "success",
+                        }
+                    )
+
+                response_text = agent.answer(prompt, session_id)
 
             return jsonify(
                 {
@@ -93,13 +128,56 @@ def chat():
         return jsonify({"error": str(e), "status": "error"}), 500
 
 
+def _sse(payload: dict) -> str:
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+@app.route("/stream_message", methods=["POST"])
+def stream_chat():
+    data = request.get_json()
+    if not data or "input" not in data:
+        return jsonify({"error": "Prompt is required"}), 400
+
+    prompt = data["input"]
+    session_id = get_session_id(data)
+
+    def generate():
+        start = time.time()
+        try:
+            with controller.session(session_id):
+                cached_answer = controller.get_cached_answer(prompt, session_id)
+                if cached_answer is not None:
+                    yield _sse({"token": cached_answer})
+                    yield _sse(
+                        {"done": True, "time": time.time() - start, "cached": True}
+                    )
+                    return
+
+                for chunk in agent.stream_answer(prompt, session_id):
+                    yield _sse({"token": chunk})
+                yield _sse({"done": True, "time": time.time() - start})
+        except Exception as e:
+            logger.info(f"Lỗi trong endpoint /stream_message: {e}")
+            yield _sse({"error": str(e), "status": "error"})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.route("/get_history", methods=["GET"])
 def get_history():
     try:
+        session_id = get_session_id()
+        offset, limit = get_pagination()
         return jsonify(
             {
-                "history": controller.get_history(),
-                "count": len(controller.get_history()),
+                "history": controller.get_history(session_id, offset, limit),
+                "count": controller.count_history(session_id),
+                "offset": offset,
+                "limit": limit,
                 "status": "success",
             }
         )
@@ -110,7 +188,7 @@ def get_history():
 @app.route("/delete_history", methods=["DELETE"])
 def delete_history():
     try:
-        message = controller.delete_history()
+        message = controller.delete_history(get_session_id())
         return jsonify({"message": message, "status": "success"})
     except Exception as e:
         return jsonify({"error": str(e), "status": "error"}), 500
@@ -145,12 +223,16 @@ def update_config():
 def export_history():
     """Export chat history"""
     try:
-        history = controller.get_history()
+        session_id = get_session_id()
+        offset, limit = get_pagination()
+        history = controller.get_history(session_id, offset, limit)
         return jsonify(
             {
                 "history": history,
                 "exported_at": time.time(),
-                "count": len(history),
+                "count": controller.count_history(session_id),
+                "offset": offset,
+                "limit": limit,
                 "status": "success",
             }
         )
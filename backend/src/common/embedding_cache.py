@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import threading
+from typing import Callable
+
+import numpy as np
+from cachetools import TTLCache
+
+
+class EmbeddingCache:
+    """Bounded LRU/TTL cache of text embeddings keyed on normalised text."""
+
+    def __init__(
+        self,
+        normalize: Callable[[str], str],
+        maxsize: int = 4096,
+        ttl: float = 3600,
+    ):
+        self.normalize = normalize
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_key(self, text: str) -> str:
+        return " ".join(self.normalize(text).split()).casefold()
+
+    def get_many(
+        self,
+        texts: list[str],
+        encode: Callable[[list[str]], np.ndarray],
+    ) -> np.ndarray:
+        """Return embeddings for `texts`, calling `encode` once for all misses."""
+        keys = [self.get_key(text) for text in texts]
+        rows = [None] * len(texts)
+        missing = {}
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._cache.get(key) if key else None
+                if vector is not None:
+                    rows[i] = vector
+                    self.hits += 1
+                else:
+                    # Texts without a usable key are always encoded, never cached.
+                    missing.setdefault(key or i, []).append(i)
+                    self.misses += 1
+
+        if missing:
+            groups = list(missing.items())
+            encoded = encode([texts[indices[0]] for _, indices in groups])
+            with self._lock:
+                for (key, indices), vector in zip(groups, encoded):
+                    vector = np.array(vector, dtype=np.float32)
+                    if isinstance(key, str):
+                        self._cache[key] = vector
+                    for i in indices:
+                        rows[i] = vector
+
+        return np.stack(rows) if rows else np.empty((0, 0), dtype=np.float32)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._cache),
+            "maxsize": self._cache.maxsize,
+            "ttl": self._cache.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
@@ -7,26 +7,46 @@ import sys
 # Add the src directory to the Python path
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
+from common.embedding_cache import EmbeddingCache
 from common.logger import get_logger
 from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer
 from service.sematic_router import (
     ChitchatProdcutsSentimentRoute,
-    SemanticRouter,
+    Embedding,
 )
 
 load_dotenv()
 logger = get_logger(__name__)
 
-# load the embedding model
-embedding_model = SentenceTransformer(os.environ["EMBEDDING_MODEL"])
+# Fields rendered by TextProcessor.transform_query.
+DOCUMENT_FIELDS = (
+    "title",
+    "product_promotion",
+    "product_specs",
+    "current_price",
+    "color_options",
+)
 
-chitchat_prodcuts_sentiment_route = ChitchatProdcutsSentimentRoute()
-senmatic_router = SemanticRouter(embedding_model)
+# Từ tham chiếu ngược tới ngữ cảnh trước đó ("nó", "máy đó", "còn ... thì sao").
+REFERENCE_PATTERN = re.compile(
+    r"\b(nó|đó|đấy|này|kia|ấy|vậy|ở trên|thì sao|thế còn)\b"
+)
+# Tên hãng hoặc mã máy (chữ + số như "s24", "15 pro") làm câu hỏi tự đủ nghĩa.
+PRODUCT_PATTERN = re.compile(
+    r"\b(iphone|ipad|samsung|galaxy|xiaomi|redmi|poco|oppo|vivo|realme|nokia|"
+    r"huawei|honor|pixel|google|oneplus|asus|rog|sony|xperia|motorola|tecno|"
+    r"infinix|itel|masstel|benco|zte|nubia|apple)\b"
+)
 
-embedding_routes = chitchat_prodcuts_sentiment_route.get_json_routesEmbedding(
-    path=r"Embedding\routesEmbedding.json",
+chitchat_prodcuts_sentiment_route = ChitchatProdcutsSentimentRoute()
+# Shared by every caller of the encoder (router, PhoneDB, semantic cache).
+query_embedding_cache = EmbeddingCache(
+    normalize=lambda text: TextProcessor.process_query(text),
+    maxsize=int(os.environ.get("EMBEDDING_CACHE_SIZE", 4096)),
+    ttl=float(os.environ.get("EMBEDDING_CACHE_TTL", 3600)),
 )
+embedder = Embedding(os.environ["EMBEDDING_MODEL"], cache=query_embedding_cache)
+senmatic_router = chitchat_prodcuts_sentiment_route.get_semanticRouter(embedder)
 
 
 class TextProcessor:
@@ -36,7 +56,8 @@ class TextProcessor:
             result += f"{message['role']}: {message['content']}\n"
         return result.strip()
 
-    def process_query(self, text: str) -> str:
+    @staticmethod
+    def process_query(text: str) -> str:
         text = re.sub(r"[^\w\s]", "", text)
         text = re.sub(r"\s+", " ", text)
         return text.strip().lower()
@@ -88,27 +109,19 @@ class TextProcessor:
             logger.info("Attempted to get embedding for empty text.")
             return []
 
-        embedding = embedding_model.encode(
-            text.replace(
-                "###",
-                "",
-            )
-            .replace("\n", "")
-            .replace("<br>", ""),
-        )
+        embedding = embedder.get_embedding([text], as_list=True)
+        return embedding[0] if embedding else []
 
-        return embedding.tolist()
+    def classification_query(self, queries: list[str]) -> list[bool]:
+        results = senmatic_router.guide_batch(queries)
+        return [intent == "products" for _, intent in results]
 
-    def classification_query(self, queries):
-        for query in queries:
-            score, intent = senmatic_router.guide(
-                query,
-                embedding_routes,
-            )
-        if intent == "products":
-            return True
-        else:
-            return False
+    def is_self_contained(self, query: str) -> bool:
+        """Câu hỏi nêu rõ sản phẩm và không tham chiếu tới lượt trước."""
+        text = self.process_query(query)
+        return bool(PRODUCT_PATTERN.search(text)) and not REFERENCE_PATTERN.search(
+            text
+        )
 
     def extension_query(self, llm, history_query) -> str:
         summary_query = "###The chat history is {history_query}. ### Output: reconstruct string".format(
@@ -116,3 +129,13 @@ class TextProcessor:
         )
 
         return llm.get_message(summary_query, stream=False)
+
+    def extension_query_with_summary(
+        self, llm, summary: str, messages: list[dict], query: str
+    ) -> str:
+        history_query = self.process_history(
+            ([{"role": "summary", "content": summary}] if summary else [])
+            + messages
+            + [{"role": "user", "content": query}]
+        )
+        return self.extension_query(llm, history_query)
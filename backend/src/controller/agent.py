@@ -4,6 +4,7 @@ from common.logger import get_logger
 from dotenv import load_dotenv
 from google.genai import types
 from infrastructure.controller_service import controller_service
+from infrastructure.stage_executor import StageGraph
 from service.LLM.llm import LLM
 
 load_dotenv()
@@ -17,11 +18,23 @@ class Agent:
         self.controller = controller_service.get_controller()
         self.tools = types.Tool(function_declarations=self.controller.get_tools())
 
-    def execute(self, prompt: str):
+    def execute(
+        self, prompt: str, session_id: str | None = None, stages: StageGraph | None = None
+    ):
+        """Chọn và chạy tool; `stages` do caller truyền vào thì caller tự ghi log đường găng."""
+        owns_stages = stages is None
+        if owns_stages:
+            stages = StageGraph()
         try:
             contents = [types.Content(role="user", parts=[types.Part(text=prompt)])]
 
-            response = llm.function_calling(contents, tools=self.tools)
+            stages.add(
+                "tool_selection", llm.function_calling, contents, self.tools
+            )
+            # Bắt đầu sớm các bước của get_general_message, song song với việc chọn tool.
+            self.controller.prefetch_general_message(prompt, session_id, stages)
+
+            response = stages.result("tool_selection")
             res = []
             # Process all function calls in order
             for fc_part in response.function_calls:
@@ -30,7 +43,11 @@ class Agent:
                 logger.info(f"🔧 Đang gọi tool: '{tool_name}' với args: {args}")
 
                 try:
-                    res.append(self.controller.execute_method_by_name(tool_name, args))
+                    res.append(
+                        self.controller.execute_method_by_name(
+                            tool_name, args, session_id=session_id, stages=stages
+                        )
+                    )
 
                 except Exception as e:
                     logger.info(f"❌ Lỗi khi gọi tool '{tool_name}': {e}")
@@ -39,3 +56,38 @@ class Agent:
         except Exception as e:
             logger.info(f"❌ Lỗi trong agent loop: {e}")
             return "Error processing agent: " + str(e)
+        finally:
+            stages.cancel_unused()
+            if owns_stages:
+                log_critical_path(stages)
+
+    def _full_query(self, prompt, session_id, stages):
+        result = self.execute(prompt, session_id, stages)
+        return result.text if hasattr(result, "text") else str(result)
+
+    def answer(self, prompt: str, session_id: str | None = None) -> str:
+        """Cả lượt hội thoại (tool + sinh câu trả lời) trong một StageGraph."""
+        stages = StageGraph()
+        try:
+            full_query = self._full_query(prompt, session_id, stages)
+            with stages.track("generation"):
+                return self.controller.get_llm_response(full_query, session_id)
+        finally:
+            log_critical_path(stages)
+
+    def stream_answer(self, prompt: str, session_id: str | None = None):
+        stages = StageGraph()
+        try:
+            full_query = self._full_query(prompt, session_id, stages)
+            with stages.track("generation"):
+                yield from self.controller.stream_llm_response(full_query, session_id)
+        finally:
+            log_critical_path(stages)
+
+
+def log_critical_path(stages: StageGraph):
+    report = stages.report()
+    logger.info(
+        f"⏱️ Critical path {' -> '.join(report['critical_path'])}: "
+        f"{report['critical_path_latency']:.2f}s"
+    )
@@ -6,14 +6,24 @@ import service.LLM.PROMPT as p
 from common.logger import get_logger
 from common.text import TextProcessor
 from dotenv import load_dotenv
-from service.LLM.llm import LLM
+from infrastructure.session_store import build_session_store
+from service.LLM.llm import LLM, LLM_ERROR_MESSAGE, LLMStreamInterrupted
 from service.LLM.tool_infos import Tools
 from service.RAG import RAG
+from service.SemantichCache import (
+    InMemorySemanticCache,
+    MongoSemanticCache,
+    SemanticAnswerCache,
+)
+from service.summarizer import ConversationSummarizer
 
 load_dotenv()
 
 logger = get_logger("ToolController")
 
+# Appended to a partial answer in the history when its stream broke off.
+INTERRUPTED_ANSWER_MARK = "\n\n(Câu trả lời bị gián đoạn)"
+
 
 class ToolController:
     def __init__(self, num_history: int = 10):
@@ -21,15 +31,50 @@ class ToolController:
         self.text_processor = TextProcessor()
         self.llm = LLM(instructions=p.model_instructions())
         self.llm_instructions = LLM(instructions=p.model_summary_chat_history_prompt())
-        self.history = []
+        self.sessions = build_session_store()
+        self.summarizer = ConversationSummarizer(self.sessions)
         self.num_history = num_history
         t = Tools()
         self.tools = t.get_tools()
+        self.answer_cache = self._build_answer_cache()
+
+    def _build_answer_cache(self):
+        ttl = float(os.environ.get("SEMANTIC_CACHE_TTL", 86400))
+        mongo_tier = None
+        if os.environ.get("DB_CACHE_NAME"):
+            try:
+                mongo_tier = MongoSemanticCache(
+                    ttl=ttl,
+                    max_size=int(os.environ.get("SEMANTIC_CACHE_MONGO_SIZE", 100000)),
+                )
+            except Exception as e:
+                logger.info(f"Mongo semantic cache disabled: {e}")
+
+        return SemanticAnswerCache(
+            get_embedding=self.text_processor.get_embedding,
+            memory_tier=InMemorySemanticCache(
+                max_size=int(os.environ.get("SEMANTIC_CACHE_SIZE", 1024)),
+                ttl=ttl,
+            ),
+            mongo_tier=mongo_tier,
+            threshold=float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", 0.94)),
+            ttl=ttl,
+        )
 
     def get_tools(self):
         return self.tools
 
-    def execute_method_by_name(self, method_name: str, params: dict):
+    def session(self, session_id: str | None = None):
+        """Phạm vi một request: lịch sử được đồng bộ với backend một lần."""
+        return self.sessions.session(session_id)
+
+    def execute_method_by_name(
+        self,
+        method_name: str,
+        params: dict,
+        session_id: str | None = None,
+        stages=None,
+    ):
         if not hasattr(self, method_name):
             logger.info(
                 f"Method '{method_name}' not found in {self.__class__.__name__}"
@@ -40,51 +85,191 @@ class ToolController:
         if not callable(method):
             logger.info(f"Attribute '{method_name}' is not callable")
 
-        return method(**params)
+        if method_name == "get_general_message":
+            params = {**params, "stages": stages}
+        return method(**params, session_id=session_id)
+
+    def rewrite_query(self, query: str, session_id: str | None = None):
+        """
+        Viết lại câu hỏi thành câu độc lập từ bản tóm tắt hội thoại và các tin
+        nhắn chưa được tóm tắt. Bỏ qua LLM khi chưa có lịch sử hoặc câu hỏi
+        đã tự đủ nghĩa.
+        """
+        if not self.sessions.count(session_id) or self.text_processor.is_self_contained(
+            query
+        ):
+            return query
 
-    def summary_chat_history(self):
-        return self.text_processor.extension_query(
-            self.llm_instructions, self.history[-self.num_history :]
+        session = self.sessions.get(session_id)
+        summary = session.state.get("summary", "")
+        num_new = session.total - session.state.get("summary_upto", 0)
+        messages = self.sessions.recent(session_id, min(num_new, self.num_history - 1))
+        return self.text_processor.extension_query_with_summary(
+            self.llm_instructions, summary, messages, query
         )
 
-    def get_general_message(self, query):
+    def prefetch_general_message(self, query, session_id, stages):
+        """
+        Chạy trước (speculative) phân loại và viết lại câu hỏi; chỉ được dùng
+        nếu agent chọn get_general_message với đúng câu hỏi này.
+        """
+        query = str(query).strip()
+        stages.add(
+            "classification",
+            lambda: self.text_processor.classification_query([query])[0],
+            speculative=True,
+        )
+        stages.add(
+            "rewrite",
+            self._prefetch_rewrite,
+            query,
+            session_id,
+            deps=("classification",),
+            speculative=True,
+        )
+        stages.context["general_query"] = query
+
+    def _prefetch_rewrite(self, query, session_id, is_needRAG):
+        # Câu hỏi không cần RAG thì không bao giờ được viết lại: bỏ qua lời gọi LLM.
+        return self.rewrite_query(query, session_id) if is_needRAG else query
+
+    def get_standalone_query(self, query: str, session_id: str | None = None):
+        """Câu hỏi độc lập với lịch sử, hoặc None nếu cần LLM để viết lại."""
+        query = str(query).strip()
+        if not query:
+            return None
+        if self.sessions.count(session_id) and not self.text_processor.is_self_contained(
+            query
+        ):
+            return None
+        return query
+
+    def get_cached_answer(self, query: str, session_id: str | None = None):
+        """Tra cache ngữ nghĩa trước khi chạy agent, không gọi LLM nào."""
+        self.sessions.get(session_id).state["cache_query"] = None
+        standalone_query = self.get_standalone_query(query, session_id)
+        if standalone_query is None:
+            return None
+
+        answer = self.answer_cache.lookup(standalone_query)
+        if answer is not None:
+            self.sessions.append(session_id, "user", standalone_query)
+            self.sessions.append(session_id, "model", answer)
+        return answer
+
+    def get_general_message(
+        self, query, session_id: str | None = None, stages=None
+    ):
         query = str(query).strip()
+        prefetched = (
+            stages is not None
+            and stages.has("classification")
+            and stages.context.get("general_query") == query
+        )
         try:
-            is_needRAG = self.text_processor.classification_query([query])
-            self.history.append({"role": "user", "content": query})
+            if prefetched:
+                is_needRAG = stages.result("classification")
+            else:
+                is_needRAG = self.text_processor.classification_query([query])[0]
+            standalone_query = self.get_standalone_query(query, session_id)
+
+            if is_needRAG and prefetched:
+                rewritten_query = stages.result("rewrite")
+            elif is_needRAG:
+                rewritten_query = self.rewrite_query(query, session_id)
+            self.sessions.append(session_id, "user", query)
 
             if is_needRAG:
-                query = self.summary_chat_history()
-                bonus_info = self.search.get_graph_search_result(query)
+                query = rewritten_query
+                standalone_query = query
+                if stages is not None:
+                    with stages.track("graph_search"):
+                        bonus_info = self.search.get_graph_search_result(query)
+                else:
+                    bonus_info = self.search.get_graph_search_result(query)
                 full_query = query + "\n" + bonus_info
             else:
                 full_query = query
 
+            # Only answers to history-independent questions are cacheable.
+            self.sessions.get(session_id).state["cache_query"] = standalone_query
             return full_query
         except Exception as e:
             logger.info(f"Error in get_product_info: {e}")
+            # The answer to an error prompt must never be cached.
+            self.sessions.get(session_id).state["cache_query"] = None
             return f"Lỗi khi xử lý truy vấn: {str(e)}  - {query}"
 
-    def get_llm_response(self, query: str):
+    def _finish_response(
+        self, response: str, session_id: str | None, succeeded: bool = True
+    ):
+        """
+        Ghi câu trả lời vào lịch sử; chỉ lưu vào cache ngữ nghĩa khi lời gọi
+        LLM thành công.
+        """
+        self.sessions.append(session_id, "model", response)
+        self.summarizer.update_async(session_id)
+        state = self.sessions.get(session_id).state
+        if succeeded and state.get("cache_query"):
+            self.answer_cache.store(state["cache_query"], response)
+        state["cache_query"] = None
+
+    def get_llm_response(self, query: str, session_id: str | None = None):
         response = self.llm.get_message(query)
-        self.history.append({"role": "model", "content": response})
+        self._finish_response(
+            response, session_id, succeeded=response != LLM_ERROR_MESSAGE
+        )
         return response
 
-    def get_history(self):
-        return self.history
+    def stream_llm_response(self, query: str, session_id: str | None = None):
+        """
+        Yield answer chunks; history and cache are updated once the stream ends.
+        An interrupted answer is kept in history with a marker, never cached,
+        and LLMStreamInterrupted is re-raised so the client can be told.
+        """
+        chunks = []
+        try:
+            for chunk in self.llm.get_message(query, stream=True):
+                chunks.append(chunk)
+                yield chunk
+        except LLMStreamInterrupted:
+            self._finish_response(
+                "".join(chunks) + INTERRUPTED_ANSWER_MARK, session_id, succeeded=False
+            )
+            raise
+
+        response = "".join(chunks)
+        self._finish_response(
+            response, session_id, succeeded=response != LLM_ERROR_MESSAGE
+        )
+
+    def get_history(
+        self,
+        session_id: str | None = None,
+        offset: int = 0,
+        limit: int | None = None,
+    ):
+        return self.sessions.get_history(session_id, offset=offset, limit=limit)
+
+    def count_history(self, session_id: str | None = None):
+        return self.sessions.count(session_id)
 
-    def delete_history(self):
-        self.history = []
+    def delete_history(self, session_id: str | None = None):
+        self.sessions.delete(session_id)
         return "History deleted successfully"
 
-    def get_shop_info(self, query, url=os.environ["LOCATION_URL"]):
-        self.history.append({"role": "user", "content": query})
+    def get_shop_info(
+        self, query, url=os.environ["LOCATION_URL"], session_id: str | None = None
+    ):
+        self.sessions.append(session_id, "user", query)
         return query + "\n" + self.search.get_shop_info(url)
 
-    def get_web_search(self, query: str, max_results: int = 3):
-        self.history.append({"role": "user", "content": query})
+    def get_web_search(
+        self, query: str, max_results: int = 3, session_id: str | None = None
+    ):
+        self.sessions.append(session_id, "user", query)
         return query + "\n" + self.search.get_web_search_result(query, max_results)
 
-    def get_product_link(self, query, product_name: str):
-        self.history.append({"role": "user", "content": query})
+    def get_product_link(self, query, product_name: str, session_id: str | None = None):
+        self.sessions.append(session_id, "user", query)
         return query + "\n" + self.search.get_product_link(product_name)
@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import os
+import threading
+
+from sentence_transformers import SentenceTransformer
+
+
+class EmbeddingModelService:
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance._models = {}
+        return cls._instance
+
+    def get_model(self, model_name: str | None = None) -> SentenceTransformer:
+        """Return the process-wide SentenceTransformer for `model_name`,
+        loading it on first use."""
+        if model_name is None:
+            model_name = os.environ["EMBEDDING_MODEL"]
+
+        model = self._models.get(model_name)
+        if model is None:
+            with self._lock:
+                model = self._models.get(model_name)
+                if model is None:
+                    model = SentenceTransformer(model_name)
+                    self._models[model_name] = model
+        return model
+
+    def release_model(self, model_name: str):
+        with self._lock:
+            self._models.pop(model_name, None)
+
+    def loaded_models(self) -> list[str]:
+        return list(self._models.keys())
+
+
+# Global instance
+embedding_service = EmbeddingModelService()
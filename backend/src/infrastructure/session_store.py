@@ -0,0 +1,393 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+import pymongo
+import pymongo.errors
+
+DEFAULT_SESSION_ID = "default"
+
+
+class Session:
+    def __init__(self, session_id: str, max_messages: int):
+        self.id = session_id
+        self.messages = deque(maxlen=max_messages)
+        # Number of messages ever appended, also kept by the persistent backend.
+        self.total = 0
+        self.size_bytes = 0
+        self.last_access = time.time()
+        # Per-turn state owned by the controller (e.g. the answer-cache key).
+        # Only "summary"/"summary_upto" are persisted by the backend.
+        self.state = {}
+        self.summary_loaded = False
+        # Open request scopes; while > 0 accessors skip the backend sync.
+        self.scopes = 0
+
+    def append(self, message: dict):
+        if len(self.messages) == self.messages.maxlen:
+            self.size_bytes -= _message_size(self.messages[0])
+        self.messages.append(message)
+        self.size_bytes += _message_size(message)
+        self.total += 1
+
+    def reset(self, messages: list[dict], total: int):
+        self.messages.clear()
+        self.size_bytes = 0
+        for message in messages[-self.messages.maxlen :]:
+            self.messages.append(message)
+            self.size_bytes += _message_size(message)
+        self.total = total
+
+
+def _message_size(message: dict) -> int:
+    return sys.getsizeof(message["role"]) + sys.getsizeof(message["content"])
+
+
+class SQLiteHistoryBackend:
+    """Lưu lịch sử vào file SQLite cục bộ, dùng chung giữa các worker trên một máy."""
+
+    def __init__(self, path: str = "sessions.db"):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "session_id TEXT NOT NULL, seq INTEGER NOT NULL, "
+                "role TEXT NOT NULL, content TEXT NOT NULL, "
+                "PRIMARY KEY (session_id, seq))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS summaries ("
+                "session_id TEXT PRIMARY KEY, summary TEXT NOT NULL, "
+                "upto INTEGER NOT NULL)"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def append(self, session_id: str, message: dict) -> int:
+        """Ghi message với seq kế tiếp của session và trả về seq đó."""
+        with self._connection() as conn:
+            # A single INSERT ... SELECT runs under SQLite's write lock, so two
+            # workers can never pick the same seq.
+            cursor = conn.execute(
+                "INSERT INTO messages "
+                "SELECT ?, COALESCE(MAX(seq) + 1, 0), ?, ? FROM messages WHERE session_id = ?",
+                (session_id, message["role"], message["content"], session_id),
+            )
+            return conn.execute(
+                "SELECT seq FROM messages WHERE rowid = ?", (cursor.lastrowid,)
+            ).fetchone()[0]
+
+    def count(self, session_id: str) -> int:
+        row = (
+            self._connection()
+            .execute(
+                "SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE session_id = ?",
+                (session_id,),
+            )
+            .fetchone()
+        )
+        return row[0]
+
+    def load(self, session_id: str, offset: int = 0, limit: int | None = None):
+        rows = (
+            self._connection()
+            .execute(
+                "SELECT role, content FROM messages WHERE session_id = ? "
+                "ORDER BY seq LIMIT ? OFFSET ?",
+                (session_id, -1 if limit is None else limit, offset),
+            )
+            .fetchall()
+        )
+        return [{"role": role, "content": content} for role, content in rows]
+
+    def load_summary(self, session_id: str):
+        """(summary, upto) đã lưu của session, hoặc None."""
+        return (
+            self._connection()
+            .execute(
+                "SELECT summary, upto FROM summaries WHERE session_id = ?",
+                (session_id,),
+            )
+            .fetchone()
+        )
+
+    def save_summary(self, session_id: str, summary: str, upto: int):
+        with self._connection() as conn:
+            # Never overwrite a summary that already covers more messages.
+            conn.execute(
+                "INSERT INTO summaries VALUES (?, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET "
+                "summary = excluded.summary, upto = excluded.upto "
+                "WHERE excluded.upto > summaries.upto",
+                (session_id, summary, upto),
+            )
+
+    def delete(self, session_id: str):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM summaries WHERE session_id = ?", (session_id,))
+
+
+class MongoHistoryBackend:
+    """Lưu lịch sử vào MongoDB để nhiều worker/máy cùng phục vụ một session."""
+
+    def __init__(self, connection_url=None, db_name=None, collection_name=None):
+        client = pymongo.MongoClient(connection_url or os.environ["MONGO_URI"])
+        db = client[db_name or os.environ["DB_NAME"]]
+        self._collection = db[
+            collection_name or os.environ.get("SESSION_COLLECTION_NAME", "sessions")
+        ]
+        self._summaries = db[
+            os.environ.get("SESSION_SUMMARY_COLLECTION_NAME", "session_summaries")
+        ]
+        self._collection.create_index(
+            [("session_id", pymongo.ASCENDING), ("seq", pymongo.ASCENDING)],
+            unique=True,
+        )
+
+    def append(self, session_id: str, message: dict, max_retries: int = 20) -> int:
+        """Ghi message với seq kế tiếp của session và trả về seq đó."""
+        for _ in range(max_retries):
+            seq = self.count(session_id)
+            try:
+                # Insert-only: the unique (session_id, seq) index rejects a seq
+                # that another worker has just taken, and we retry with the new count.
+                self._collection.insert_one(
+                    {"session_id": session_id, "seq": seq, **message}
+                )
+                return seq
+            except pymongo.errors.DuplicateKeyError:
+                continue
+        raise RuntimeError(
+            f"Could not append to session {session_id} after {max_retries} attempts"
+        )
+
+    def count(self, session_id: str) -> int:
+        last = self._collection.find_one(
+            {"session_id": session_id}, {"seq": 1}, sort=[("seq", -1)]
+        )
+        return last["seq"] + 1 if last else 0
+
+    def load(self, session_id: str, offset: int = 0, limit: int | None = None):
+        cursor = (
+            self._collection.find(
+                {"session_id": session_id}, {"_id": 0, "role": 1, "content": 1}
+            )
+            .sort("seq", 1)
+            .skip(offset)
+        )
+        if limit is not None:
+            cursor = cursor.limit(limit)
+        return list(cursor)
+
+    def load_summary(self, session_id: str):
+        """(summary, upto) đã lưu của session, hoặc None."""
+        doc = self._summaries.find_one({"_id": session_id})
+        return (doc["summary"], doc["upto"]) if doc else None
+
+    def save_summary(self, session_id: str, summary: str, upto: int):
+        try:
+            # Never overwrite a summary that already covers more messages: the
+            # filter then misses and the upsert hits the existing _id.
+            self._summaries.update_one(
+                {"_id": session_id, "upto": {"$lt": upto}},
+                {"$set": {"summary": summary, "upto": upto}},
+                upsert=True,
+            )
+        except pymongo.errors.DuplicateKeyError:
+            pass
+
+    def delete(self, session_id: str):
+        self._collection.delete_many({"session_id": session_id})
+        self._summaries.delete_one({"_id": session_id})
+
+
+class SessionStore:
+    """
+    Lịch sử hội thoại theo session: mỗi session là một ring buffer, toàn bộ
+    store bị giới hạn theo số session, TTL và tổng dung lượng (LRU eviction).
+    Nếu có backend thì backend là nguồn dữ liệu chính, bộ nhớ chỉ là cache:
+    mỗi request mở `session(id)` để đồng bộ với backend một lần, các hàm
+    get/count/recent bên trong dùng lại Session đã cache. Ngoài lịch sử,
+    backend chỉ lưu bản tóm tắt; phần còn lại của `Session.state` là của
+    từng process.
+    """
+
+    def __init__(
+        self,
+        max_messages: int = 50,
+        max_sessions: int = 1000,
+        ttl: float = 3600,
+        max_bytes: int = 64 * 1024 * 1024,
+        backend=None,
+    ):
+        self.max_messages = max_messages
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.backend = backend
+        self._sessions = OrderedDict()
+        self._size_bytes = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, session_id: str | None) -> Session:
+        session_id = session_id or DEFAULT_SESSION_ID
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = Session(session_id, self.max_messages)
+                self._sessions[session_id] = session
+            else:
+                self._sessions.move_to_end(session_id)
+            session.last_access = time.time()
+            if session.scopes == 0:
+                self._sync(session)
+            self._evict()
+            return session
+
+    @contextmanager
+    def session(self, session_id: str | None):
+        """Phạm vi một request: chỉ đồng bộ với backend một lần khi vào."""
+        session = self.get(session_id)
+        with self._lock:
+            session.scopes += 1
+        try:
+            yield session
+        finally:
+            with self._lock:
+                session.scopes -= 1
+
+    def _sync(self, session: Session):
+        # Another worker may have appended to this session through the backend.
+        if self.backend is None:
+            return
+        total = self.backend.count(session.id)
+        reload = total != session.total
+        if reload:
+            self._size_bytes -= session.size_bytes
+            offset = max(0, total - self.max_messages)
+            session.reset(self.backend.load(session.id, offset=offset), total)
+            self._size_bytes += session.size_bytes
+        if reload or not session.summary_loaded:
+            saved = self.backend.load_summary(session.id)
+            if saved is not None and saved[1] > session.state.get("summary_upto", 0):
+                session.state["summary"], session.state["summary_upto"] = saved
+            session.summary_loaded = True
+
+    def save_summary(self, session_id: str | None, summary: str, upto: int):
+        if self.backend is not None:
+            self.backend.save_summary(session_id or DEFAULT_SESSION_ID, summary, upto)
+
+    def append(self, session_id: str | None, role: str, content: str):
+        message = {"role": role, "content": content}
+        with self._lock:
+            session = self.get(session_id)
+            if self.backend is not None:
+                seq = self.backend.append(session.id, message)
+                if seq != session.total:
+                    # Another worker appended in the meantime: reload from the
+                    # backend, which now also holds this message.
+                    self._sync(session)
+                    self._evict()
+                    return
+            self._size_bytes -= session.size_bytes
+            session.append(message)
+            self._size_bytes += session.size_bytes
+            self._evict()
+
+    def recent(self, session_id: str | None, n: int) -> list[dict]:
+        session = self.get(session_id)
+        with self._lock:
+            messages = list(session.messages)
+        return messages[-n:] if n > 0 else []
+
+    def count(self, session_id: str | None) -> int:
+        return self.get(session_id).total
+
+    def get_history(
+        self, session_id: str | None, offset: int = 0, limit: int | None = None
+    ) -> list[dict]:
+        session = self.get(session_id)
+        if self.backend is not None:
+            return self.backend.load(session.id, offset=offset, limit=limit)
+
+        with self._lock:
+            # Only the ring buffer is kept, older messages are gone.
+            first = session.total - len(session.messages)
+            messages = list(session.messages)[max(0, offset - first) :]
+        return messages if limit is None else messages[:limit]
+
+    def delete(self, session_id: str | None):
+        session_id = session_id or DEFAULT_SESSION_ID
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is not None:
+                self._size_bytes -= session.size_bytes
+            if self.backend is not None:
+                self.backend.delete(session_id)
+
+    def _evict(self):
+        now = time.time()
+        expired = [
+            session_id
+            for session_id, session in self._sessions.items()
+            if now - session.last_access > self.ttl
+        ]
+        for session_id in expired:
+            self._drop(session_id)
+
+        # The most recently used session is never evicted.
+        while len(self._sessions) > 1 and (
+            len(self._sessions) > self.max_sessions
+            or self._size_bytes > self.max_bytes
+        ):
+            self._drop(next(iter(self._sessions)))
+
+    def _drop(self, session_id: str):
+        # Only frees memory; persisted history stays in the backend.
+        session = self._sessions.pop(session_id)
+        self._size_bytes -= session.size_bytes
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self._sessions),
+            "size_bytes": self._size_bytes,
+            "max_sessions": self.max_sessions,
+            "max_bytes": self.max_bytes,
+            "backend": type(self.backend).__name__ if self.backend else None,
+        }
+
+
+def build_session_store() -> SessionStore:
+    backend_name = os.environ.get("SESSION_BACKEND", "memory")
+    backend = None
+    if backend_name == "sqlite":
+        backend = SQLiteHistoryBackend(
+            os.environ.get("SESSION_SQLITE_PATH", "sessions.db")
+        )
+    elif backend_name == "mongo":
+        backend = MongoHistoryBackend()
+
+    return SessionStore(
+        max_messages=int(os.environ.get("SESSION_MAX_MESSAGES", 50)),
+        max_sessions=int(os.environ.get("SESSION_MAX_SESSIONS", 1000)),
+        ttl=float(os.environ.get("SESSION_TTL", 3600)),
+        max_bytes=int(os.environ.get("SESSION_MAX_BYTES", 64 * 1024 * 1024)),
+        backend=backend,
+    )
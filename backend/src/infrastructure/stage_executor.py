@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+
+# Shared by every request so that the number of OS threads stays bounded.
+stage_pool = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("STAGE_WORKERS", 16)),
+    thread_name_prefix="stage",
+)
+
+
+class Stage:
+    def __init__(self, name, fn, args, deps, speculative):
+        self.name = name
+        self.fn = fn
+        self.args = args
+        self.deps = tuple(deps)
+        self.speculative = speculative
+        self.future = Future()
+        self.used = not speculative
+        self.submitted_at = None
+        self.started_at = None
+        self.finished_at = None
+
+
+class StageGraph:
+    """
+    Chạy các bước của một lượt hội thoại song song theo phụ thuộc.
+
+    Một stage được đưa vào pool ngay khi mọi stage nó phụ thuộc đã xong; kết
+    quả của các stage phụ thuộc được truyền vào sau `args`. Stage speculative
+    chỉ được tính là "dùng" khi có ai gọi `result()`; `cancel_unused()` huỷ
+    những stage chưa chạy và bỏ qua kết quả của những stage đang chạy (thread
+    Python không thể dừng giữa chừng).
+    """
+
+    def __init__(self, executor: ThreadPoolExecutor = stage_pool):
+        self.executor = executor
+        self.stages = {}
+        # Free-form data shared between the producers and consumers of stages.
+        self.context = {}
+        self.started_at = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def has(self, name: str) -> bool:
+        return name in self.stages
+
+    def add(self, name, fn, *args, deps=(), speculative=False) -> Future:
+        if name in self.stages:
+            raise ValueError(f"Stage '{name}' already exists")
+        missing = [dep for dep in deps if dep not in self.stages]
+        if missing:
+            raise ValueError(f"Stage '{name}' depends on unknown stages {missing}")
+
+        stage = Stage(name, fn, args, deps, speculative)
+        self.stages[name] = stage
+
+        pending = {"count": len(stage.deps)}
+        if not stage.deps:
+            self._submit(stage)
+        for dep in stage.deps:
+            self.stages[dep].future.add_done_callback(
+                lambda _, stage=stage, pending=pending: self._on_dep_done(
+                    stage, pending
+                )
+            )
+        return stage.future
+
+    def _on_dep_done(self, stage, pending):
+        with self._lock:
+            pending["count"] -= 1
+            ready = pending["count"] == 0
+        if not ready:
+            return
+
+        failed = [
+            dep
+            for dep in stage.deps
+            if self.stages[dep].future.cancelled()
+            or self.stages[dep].future.exception() is not None
+        ]
+        if failed:
+            if not stage.future.cancel():
+                stage.future.set_exception(
+                    RuntimeError(f"Stage '{stage.name}' skipped, {failed} failed")
+                )
+            return
+        self._submit(stage)
+
+    def _submit(self, stage):
+        stage.submitted_at = time.perf_counter()
+
+        def _run():
+            if not stage.future.set_running_or_notify_cancel():
+                return
+            stage.started_at = time.perf_counter()
+            try:
+                dep_results = [self.stages[dep].future.result() for dep in stage.deps]
+                result = stage.fn(*stage.args, *dep_results)
+            except BaseException as e:
+                stage.finished_at = time.perf_counter()
+                stage.future.set_exception(e)
+            else:
+                stage.finished_at = time.perf_counter()
+                stage.future.set_result(result)
+
+        self.executor.submit(_run)
+
+    @contextmanager
+    def track(self, name, deps=None):
+        """
+        Ghi nhận một bước chạy ngay trên thread gọi (tra cứu đồ thị, sinh câu
+        trả lời, ...) để nó có mặt trong `report()`. Mặc định bước này phụ
+        thuộc mọi stage đã dùng trước đó.
+        """
+        if name in self.stages:
+            raise ValueError(f"Stage '{name}' already exists")
+        if deps is None:
+            deps = [dep for dep, stage in self.stages.items() if stage.used]
+        stage = Stage(name, None, (), deps, speculative=False)
+        self.stages[name] = stage
+        stage.submitted_at = stage.started_at = time.perf_counter()
+        stage.future.set_running_or_notify_cancel()
+        try:
+            yield stage
+        except BaseException as e:
+            stage.finished_at = time.perf_counter()
+            stage.future.set_exception(e)
+            raise
+        else:
+            stage.finished_at = time.perf_counter()
+            stage.future.set_result(None)
+
+    def result(self, name: str, timeout: float | None = None):
+        self._mark_used(name)
+        return self.stages[name].future.result(timeout=timeout)
+
+    def _mark_used(self, name: str):
+        stage = self.stages[name]
+        stage.used = True
+        for dep in stage.deps:
+            self._mark_used(dep)
+
+    def cancel(self, name: str) -> bool:
+        stage = self.stages.get(name)
+        if stage is None:
+            return False
+        stage.used = False
+        return stage.future.cancel()
+
+    def cancel_unused(self):
+        for stage in self.stages.values():
+            if stage.speculative and not stage.used:
+                stage.future.cancel()
+
+    def report(self) -> dict:
+        """
+        Thời gian từng stage và đường găng (critical path): chuỗi stage đã
+        dùng kết thúc muộn nhất, mỗi bước lùi về phụ thuộc kết thúc muộn nhất.
+        """
+        finished = {
+            name: stage
+            for name, stage in self.stages.items()
+            if stage.finished_at is not None
+        }
+        stages = {
+            name: {
+                "duration": stage.finished_at - stage.started_at,
+                "end": stage.finished_at - self.started_at,
+                "used": stage.used,
+            }
+            for name, stage in finished.items()
+        }
+
+        used = [stage for stage in finished.values() if stage.used]
+        path = []
+        stage = max(used, key=lambda s: s.finished_at, default=None)
+        while stage is not None:
+            path.append(stage.name)
+            deps = [finished[dep] for dep in stage.deps if dep in finished]
+            stage = max(deps, key=lambda s: s.finished_at, default=None)
+        path.reverse()
+
+        return {
+            "stages": stages,
+            "critical_path": path,
+            "critical_path_latency": stages[path[-1]]["end"] if path else 0.0,
+            "wall_time": time.perf_counter() - self.started_at,
+        }
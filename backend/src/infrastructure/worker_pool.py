@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from common.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class BoundedWorkerPool:
+    """
+    Thread pool dùng chung với giới hạn số tác vụ chạy đồng thời trên toàn
+    process, timeout cho từng lời gọi và số liệu về hàng đợi/độ trễ.
+    """
+
+    def __init__(self, max_workers: int = 8, name: str = "worker"):
+        self.name = name
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=name
+        )
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self._total_latency = 0.0
+        self._max_latency = 0.0
+        self._total_wait = 0.0
+
+    def submit(self, fn, *args, **kwargs):
+        submitted_at = time.perf_counter()
+        with self._lock:
+            self._queued += 1
+
+        def _run():
+            started_at = time.perf_counter()
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+                self._total_wait += started_at - submitted_at
+            ok = False
+            try:
+                result = fn(*args, **kwargs)
+                ok = True
+                return result
+            finally:
+                latency = time.perf_counter() - started_at
+                with self._lock:
+                    self._running -= 1
+                    if ok:
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+                    self._total_latency += latency
+                    self._max_latency = max(self._max_latency, latency)
+
+        future = self._executor.submit(_run)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future):
+        # A cancelled task never ran, so it is still counted as queued.
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+
+    def map(self, fn, items, timeout: float | None = None, default=None) -> list:
+        """
+        Chạy `fn` cho từng phần tử và trả về kết quả theo đúng thứ tự đầu vào.
+        Phần tử lỗi hoặc quá `timeout` giây (tính từ lúc gọi) nhận `default`.
+        """
+        futures = [self.submit(fn, item) for item in items]
+        deadline = None if timeout is None else time.perf_counter() + timeout
+
+        results = []
+        for future in futures:
+            remaining = (
+                None if deadline is None else max(0.0, deadline - time.perf_counter())
+            )
+            try:
+                results.append(future.result(timeout=remaining))
+            except FutureTimeoutError:
+                # Tasks that have not started yet are dropped from the queue.
+                future.cancel()
+                with self._lock:
+                    self.timeouts += 1
+                results.append(default)
+            except Exception as e:
+                logger.info(f"[{self.name}] task failed: {e}")
+                results.append(default)
+        return results
+
+    def stats(self) -> dict:
+        with self._lock:
+            finished = self.completed + self.failed
+            return {
+                "max_workers": self.max_workers,
+                "queue_depth": self._queued,
+                "in_flight": self._running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "timeouts": self.timeouts,
+                "avg_latency": self._total_latency / finished if finished else 0.0,
+                "max_latency": self._max_latency,
+                "avg_queue_wait": self._total_wait / finished if finished else 0.0,
+            }
+
+
+# Global limit on concurrent LLM calls across every request in this process.
+llm_pool = BoundedWorkerPool(
+    max_workers=int(os.environ.get("LLM_MAX_CONCURRENCY", 8)), name="llm"
+)
@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import os
+import sys
+import threading
+
+import numpy as np
+
+# Add the src directory to the Python path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from common.logger import get_logger
+
+logger = get_logger(__name__)
+
+CATALOG_FIELDS = (
+    "url",
+    "title",
+    "product_promotion",
+    "product_specs",
+    "current_price",
+    "color_options",
+)
+
+
+# Marks a field that the document does not have, as opposed to a None value.
+_MISSING = object()
+
+
+class _Columns:
+    """Immutable column snapshot; a refresh builds a new one and swaps it in."""
+
+    def __init__(self, docs: list[dict]):
+        self.ids = [doc["_id"] for doc in docs]
+        self.row_of = {str(doc_id): i for i, doc_id in enumerate(self.ids)}
+        self.title = [doc.get("title", _MISSING) for doc in docs]
+        self.url = [doc.get("url", _MISSING) for doc in docs]
+        self.current_price = [doc.get("current_price", _MISSING) for doc in docs]
+        self.product_promotion = [doc.get("product_promotion", _MISSING) for doc in docs]
+
+        # Long specs text and colour lists are stored flat with offsets
+        # instead of one Python object per document.
+        specs = [doc.get("product_specs") for doc in docs]
+        self.has_specs = np.array([s is not None for s in specs], dtype=bool)
+        specs = [s or "" for s in specs]
+        self.specs_blob = "".join(specs)
+        self.specs_offsets = np.zeros(len(docs) + 1, dtype=np.int64)
+        np.cumsum([len(s) for s in specs], out=self.specs_offsets[1:])
+
+        colors = [doc.get("color_options") for doc in docs]
+        self.has_colors = np.array([c is not None for c in colors], dtype=bool)
+        colors = [c or [] for c in colors]
+        self.colors = [color for options in colors for color in options]
+        self.color_offsets = np.zeros(len(docs) + 1, dtype=np.int64)
+        np.cumsum([len(c) for c in colors], out=self.color_offsets[1:])
+
+    def row(self, i: int) -> dict:
+        doc = {
+            "_id": self.ids[i],
+            "url": self.url[i],
+            "title": self.title[i],
+            "product_promotion": self.product_promotion[i],
+            "current_price": self.current_price[i],
+        }
+        # Missing fields stay missing so that TextProcessor falls back to "N/A".
+        if self.has_specs[i]:
+            doc["product_specs"] = self.specs_blob[
+                self.specs_offsets[i] : self.specs_offsets[i + 1]
+            ]
+        if self.has_colors[i]:
+            doc["color_options"] = self.colors[
+                self.color_offsets[i] : self.color_offsets[i + 1]
+            ]
+        return {key: value for key, value in doc.items() if value is not _MISSING}
+
+
+class CatalogStore:
+    """
+    Compact in-memory copy of the phone catalog, loaded once with a narrow
+    projection (no embedding vectors) and shared by every component that
+    needs product data. Lookups by `_id` are O(1); `start_auto_refresh`
+    reloads it on a schedule.
+    """
+
+    def __init__(self, collection, fields=CATALOG_FIELDS):
+        self._collection = collection
+        self.fields = tuple(fields)
+        self._columns = _Columns([])
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+        self._stop_refresh = threading.Event()
+        self._listeners = []
+        self.load()
+
+    def __len__(self):
+        return len(self._columns.ids)
+
+    def load(self):
+        docs = list(self._collection.find({}, {field: 1 for field in self.fields}))
+        columns = _Columns(docs)
+        with self._lock:
+            self._columns = columns
+        logger.info(f"Loaded {len(docs)} products into the catalog store")
+        for callback in self._listeners:
+            callback(self)
+
+    def refresh(self):
+        self.load()
+
+    def subscribe(self, callback):
+        """Calls callback(store) after every reload, e.g. to rebuild derived indexes."""
+        self._listeners.append(callback)
+
+    def start_auto_refresh(self, interval: float = 300):
+        if self._refresh_thread is not None:
+            return
+
+        def _loop():
+            while not self._stop_refresh.wait(interval):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logger.info(f"Catalog store refresh failed: {e}")
+
+        self._refresh_thread = threading.Thread(target=_loop, daemon=True)
+        self._refresh_thread.start()
+
+    def stop_auto_refresh(self):
+        self._stop_refresh.set()
+        self._refresh_thread = None
+
+    def get(self, doc_id) -> dict | None:
+        columns = self._columns
+        row = columns.row_of.get(str(doc_id))
+        return None if row is None else columns.row(row)
+
+    def get_many(self, doc_ids) -> list[dict]:
+        """Documents in the order of `doc_ids`, skipping unknown ids."""
+        columns = self._columns
+        rows = (columns.row_of.get(str(doc_id)) for doc_id in doc_ids)
+        return [columns.row(row) for row in rows if row is not None]
+
+    def documents(self) -> list[dict]:
+        columns = self._columns
+        return [columns.row(i) for i in range(len(columns.ids))]
+
+    def title_to_url(self) -> dict:
+        columns = self._columns
+        return {
+            title: url
+            for title, url in zip(columns.title, columns.url)
+            if title is not _MISSING and url is not _MISSING
+        }
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_catalog_store(collection) -> CatalogStore:
+    """One CatalogStore per collection and process, created on first use."""
+    key = (collection.database.name, collection.name)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = CatalogStore(collection)
+            interval = float(os.environ.get("CATALOG_REFRESH_INTERVAL", 300))
+            if interval > 0:
+                store.start_auto_refresh(interval)
+            _stores[key] = store
+        return store
@@ -8,6 +8,8 @@ import dotenv
 import pymongo
 from common.logger import get_logger
 from common.text import TextProcessor
+from model.catalog_store import get_catalog_store
+from model.vector_index import LocalVectorIndex
 
 # from common.text import get_embedding
 
@@ -16,7 +18,11 @@ logger = get_logger(__name__)
 
 
 class PhoneDB:
-    def __init__(self, connection_url=os.environ["MONGO_URI"]):
+    def __init__(
+        self,
+        connection_url=os.environ["MONGO_URI"],
+        retrieval_backend=os.environ.get("RETRIEVAL_BACKEND", "atlas"),
+    ):
         try:
             self.connection_url = connection_url.split("@")[-1]
             self.connection = pymongo.MongoClient(connection_url)
@@ -28,15 +34,47 @@ class PhoneDB:
             return None
 
         self.text_processor = TextProcessor()
+        self.retrieval_backend = retrieval_backend
+        self.local_index = None
+        if retrieval_backend == "local":
+            # Only vectors are indexed; documents come from the catalog store.
+            self.local_index = LocalVectorIndex(
+                self._collection,
+                fields=(),
+                approximate=os.environ.get("LOCAL_INDEX_APPROXIMATE") == "1",
+                version_field=os.environ.get("LOCAL_INDEX_VERSION_FIELD", "updated_at"),
+            )
+            self.local_index.start_auto_refresh(
+                float(os.environ.get("LOCAL_INDEX_REFRESH_INTERVAL", 300))
+            )
+
+    @property
+    def catalog(self):
+        return get_catalog_store(self._collection)
 
     def get_all(self):
-        return list(self._collection.find({}))
+        return self.catalog.documents()
+
+    def iter_all(self, after_id=None, projection=None, batch_size=100):
+        """Duyệt toàn bộ collection theo thứ tự _id, bắt đầu sau `after_id`."""
+        query = {} if after_id is None else {"_id": {"$gt": after_id}}
+        return (
+            self._collection.find(query, projection)
+            .sort("_id", pymongo.ASCENDING)
+            .batch_size(batch_size)
+        )
+
+    def get_by_ids(self, ids, projection=None):
+        return list(self._collection.find({"_id": {"$in": list(ids)}}, projection))
 
     def vector_search(self, user_query, num_candidates=100, k=20):
         query_embedding = self.text_processor.get_embedding(user_query)
         if query_embedding is None:
             return "Invalid query or embedding generation failed."
 
+        if self.local_index is not None:
+            return self._hydrate(self.local_index.search(query_embedding, k=k))
+
         vector_search_stage = {
             "$vectorSearch": {
                 "index": "vector_index",
@@ -47,36 +85,36 @@ class PhoneDB:
             },
         }
 
-        unset_stage = {
-            "$unset": "embedding",
-        }
-
+        # Only ids and scores go over the wire; the product fields are read
+        # from the catalog store.
         project_stage = {
             "$project": {
-                "_id": 0,  # Exclude the _id field
-                "url": 1,  # Include the Phone url
-                "title": 1,  # Include the Phone field
-                "product_promotion": 1,  # Include the Description field
-                "product_specs": 1,  # Include the specs field
-                "current_price": 1,
-                "color_options": 1,
+                "_id": 1,
                 "score": {
                     "$meta": "vectorSearchScore",  # Include the search score
                 },
             },
         }
 
-        sort_stage = {
-            "$sort": {
-                "score": -1  # Sort by vectorSearchScore in descending order (highest scores first)
-            }
-        }
-
-        pipeline = [vector_search_stage, unset_stage, project_stage, sort_stage]
+        # $vectorSearch already returns documents ordered by score.
+        pipeline = [vector_search_stage, project_stage]
 
         # Thực thi pipeline
         results = self._collection.aggregate(pipeline)
-        return list(results)
+        return self._hydrate(results)
+
+    def _hydrate(self, hits) -> list[dict]:
+        """Thay các kết quả (_id, score) bằng sản phẩm tương ứng trong catalog."""
+        results = []
+        for hit in hits:
+            doc = self.catalog.get(hit["_id"])
+            # Products added after the last catalog refresh are skipped.
+            if doc is None:
+                continue
+            doc.pop("_id")
+            doc["score"] = hit["score"]
+            results.append(doc)
+        return results
 
     def __del__(self):
         if self.connection:
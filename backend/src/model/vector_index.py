@@ -0,0 +1,295 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import sys
+import threading
+
+import numpy as np
+
+# Add the src directory to the Python path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from common.logger import get_logger
+
+logger = get_logger(__name__)
+
+PROJECTED_FIELDS = (
+    "url",
+    "title",
+    "product_promotion",
+    "product_specs",
+    "current_price",
+    "color_options",
+)
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _content_hash(doc: dict, fields) -> str:
+    h = hashlib.sha1()
+    for field in fields:
+        h.update(repr(doc.get(field)).encode("utf-8"))
+    h.update(np.asarray(doc.get("embedding", []), dtype=np.float32).tobytes())
+    return h.hexdigest()
+
+
+class LocalVectorIndex:
+    """
+    In-process vector index over the phone catalog, a drop-in alternative to
+    Atlas $vectorSearch. Exact search is a single matmul; with
+    `approximate=True` an IVF (k-means lists) index limits the scan to the
+    `n_probe` closest lists.
+
+    `refresh` polls only `_id` and `version_field` (e.g. an `updated_at`
+    stamp the writer maintains) and re-reads embeddings just for new ids and
+    ids whose version changed. Documents without `version_field` are re-read
+    on every poll.
+    """
+
+    def __init__(
+        self,
+        collection,
+        fields=PROJECTED_FIELDS,
+        approximate: bool = False,
+        n_lists: int | None = None,
+        n_probe: int = 4,
+        version_field: str = "updated_at",
+    ):
+        self._collection = collection
+        self.fields = tuple(fields)
+        self.approximate = approximate
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.version_field = version_field
+
+        self._lock = threading.RLock()
+        self._ids = []
+        self._docs = []
+        self._hashes = []
+        self._versions = []
+        self._position = {}
+        self._matrix = np.empty((0, 0), dtype=np.float32)
+        self._centroids = None
+        self._assignments = None
+        self._refresh_thread = None
+        self._stop_refresh = threading.Event()
+
+        self.load()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _projection(self):
+        projection = {field: 1 for field in self.fields}
+        projection["embedding"] = 1
+        projection[self.version_field] = 1
+        return projection
+
+    def _fetch(self, ids=None, batch_size: int = 500):
+        if ids is None:
+            cursors = [self._collection.find({}, self._projection())]
+        else:
+            ids = list(ids)
+            cursors = (
+                self._collection.find(
+                    {"_id": {"$in": ids[start : start + batch_size]}},
+                    self._projection(),
+                )
+                for start in range(0, len(ids), batch_size)
+            )
+        for cursor in cursors:
+            for doc in cursor:
+                if doc.get("embedding"):
+                    yield doc
+
+    def _poll_versions(self) -> dict:
+        return {
+            doc["_id"]: doc.get(self.version_field)
+            for doc in self._collection.find({}, {self.version_field: 1})
+        }
+
+    def load(self):
+        ids, docs, hashes, versions, vectors = [], [], [], [], []
+        for doc in self._fetch():
+            ids.append(doc["_id"])
+            docs.append({field: doc.get(field) for field in self.fields})
+            hashes.append(_content_hash(doc, self.fields))
+            versions.append(doc.get(self.version_field))
+            vectors.append(doc["embedding"])
+
+        matrix = (
+            _normalize_rows(np.asarray(vectors, dtype=np.float32))
+            if vectors
+            else np.empty((0, 0), dtype=np.float32)
+        )
+        with self._lock:
+            self._ids, self._docs, self._hashes = ids, docs, hashes
+            self._versions = versions
+            self._position = {doc_id: i for i, doc_id in enumerate(ids)}
+            self._matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+            self._build_ivf()
+        logger.info(f"Loaded {len(ids)} documents into the local vector index")
+
+    def refresh(self) -> int:
+        """
+        Poll `_id` and `version_field`, re-read the full documents only for
+        new or re-versioned ids and apply the ones whose content hash
+        changed, plus inserts and deletions. Returns the number of rows that
+        changed.
+        """
+        with self._lock:
+            positions = dict(self._position)
+            hashes, versions = list(self._hashes), list(self._versions)
+
+        polled = self._poll_versions()
+        stale = [
+            doc_id
+            for doc_id, version in polled.items()
+            if version is None
+            or doc_id not in positions
+            or versions[positions[doc_id]] != version
+        ]
+
+        changed_rows, new_docs, fetched, version_updates = {}, [], set(), {}
+        for doc in self._fetch(stale):
+            doc_id = doc["_id"]
+            fetched.add(doc_id)
+            content_hash = _content_hash(doc, self.fields)
+            position = positions.get(doc_id)
+            if position is None:
+                new_docs.append((doc, content_hash))
+                continue
+            version_updates[position] = doc.get(self.version_field)
+            if hashes[position] != content_hash:
+                changed_rows[position] = (doc, content_hash)
+
+        with self._lock:
+            for position, version in version_updates.items():
+                self._versions[position] = version
+            # Gone from the collection, or re-read and no longer has an embedding.
+            stale = set(stale)
+            removed = [
+                i
+                for i, doc_id in enumerate(self._ids)
+                if doc_id not in polled or (doc_id in stale and doc_id not in fetched)
+            ]
+            if not (changed_rows or new_docs or removed):
+                return 0
+
+            matrix = self._matrix
+            for position, (doc, content_hash) in changed_rows.items():
+                self._docs[position] = {field: doc.get(field) for field in self.fields}
+                self._hashes[position] = content_hash
+                matrix[position] = _normalize_rows(
+                    np.asarray([doc["embedding"]], dtype=np.float32),
+                )[0]
+
+            if removed:
+                keep = np.setdiff1d(np.arange(len(self._ids)), removed)
+                matrix = matrix[keep]
+                self._ids = [self._ids[i] for i in keep]
+                self._docs = [self._docs[i] for i in keep]
+                self._hashes = [self._hashes[i] for i in keep]
+                self._versions = [self._versions[i] for i in keep]
+
+            if new_docs:
+                vectors = _normalize_rows(
+                    np.asarray([doc["embedding"] for doc, _ in new_docs], dtype=np.float32),
+                )
+                matrix = np.concatenate([matrix, vectors]) if len(matrix) else vectors
+                for doc, content_hash in new_docs:
+                    self._ids.append(doc["_id"])
+                    self._docs.append({field: doc.get(field) for field in self.fields})
+                    self._hashes.append(content_hash)
+                    self._versions.append(doc.get(self.version_field))
+
+            self._matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+            self._position = {doc_id: i for i, doc_id in enumerate(self._ids)}
+            self._build_ivf()
+
+        num_changed = len(changed_rows) + len(new_docs) + len(removed)
+        logger.info(f"Local vector index refreshed, {num_changed} documents changed")
+        return num_changed
+
+    def start_auto_refresh(self, interval: float = 300):
+        if self._refresh_thread is not None:
+            return
+
+        def _loop():
+            while not self._stop_refresh.wait(interval):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logger.info(f"Local vector index refresh failed: {e}")
+
+        self._refresh_thread = threading.Thread(target=_loop, daemon=True)
+        self._refresh_thread.start()
+
+    def stop_auto_refresh(self):
+        self._stop_refresh.set()
+        self._refresh_thread = None
+
+    def _build_ivf(self, num_iters: int = 10):
+        self._centroids = None
+        self._assignments = None
+        num_rows = len(self._matrix)
+        if not self.approximate or num_rows == 0:
+            return
+
+        n_lists = self.n_lists or max(1, int(np.sqrt(num_rows)))
+        n_lists = min(n_lists, num_rows)
+        rng = np.random.default_rng(0)
+        centroids = self._matrix[rng.choice(num_rows, n_lists, replace=False)]
+        for _ in range(num_iters):
+            assignments = np.argmax(self._matrix @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, self._matrix)
+            empty = np.bincount(assignments, minlength=n_lists) == 0
+            sums[empty] = centroids[empty]
+            centroids = _normalize_rows(sums)
+
+        self._centroids = centroids.astype(np.float32)
+        self._assignments = np.argmax(self._matrix @ self._centroids.T, axis=1)
+
+    def search(self, query_embedding, k: int = 20) -> list[dict]:
+        """
+        Top-k documents with their `_id` and the projected fields.
+        `score` follows vectorSearchScore for cosine: (1 + cos) / 2.
+        """
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        query = query / norm
+
+        with self._lock:
+            if len(self._matrix) == 0:
+                return []
+
+            if self._centroids is not None:
+                probe = np.argsort(-(self._centroids @ query))[: self.n_probe]
+                candidates = np.flatnonzero(np.isin(self._assignments, probe))
+            else:
+                candidates = np.arange(len(self._matrix))
+            if len(candidates) == 0 or k <= 0:
+                return []
+
+            scores = self._matrix[candidates] @ query
+            k = min(k, len(candidates))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+
+            return [
+                {
+                    "_id": self._ids[candidates[i]],
+                    **self._docs[candidates[i]],
+                    "score": float((1 + scores[i]) / 2),
+                }
+                for i in top
+            ]
+
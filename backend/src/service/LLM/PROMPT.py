@@ -10,6 +10,11 @@ SUMMARY_CHAT_HISTORY_PROMPT = """Based on the user's conversation history and th
                                 history. Do not answer this query, just reconstruct it if necessary, and if there is not enough information to construct a new question,
                                 keep the original question unchanged"""
 
+ROLLING_SUMMARY_PROMPT = """Update the running summary of a conversation between a customer and a phone
+                                store assistant. Keep it short (at most 5 sentences, in Vietnamese) and keep only what is
+                                needed to understand later questions: products, models, prices, preferences and open questions.
+                                Return only the new summary."""
+
 SHOP_INFOMATION_INSTRUCTION = """
 Use this function when the user asks about information related to a store, such as its name, address, or opening/closing hours. 
 This includes questions like:
@@ -135,6 +140,18 @@ def model_summary_chat_history_prompt() -> str:
     return SUMMARY_CHAT_HISTORY_PROMPT
 
 
+def model_rolling_summary_prompt() -> str:
+    return ROLLING_SUMMARY_PROMPT
+
+
+def rolling_summary_prompt(summary: str, new_messages: str) -> str:
+    return (
+        f"###Current summary: {summary or '(empty)'}\n"
+        f"###New messages:\n{new_messages}\n"
+        "### Output: updated summary"
+    )
+
+
 def extract_entity_relationship_prompt(text: str) -> str:
     return (
         "Extract entities (nodes) and their relationships (edges) from the text below."
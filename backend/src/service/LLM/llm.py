@@ -2,6 +2,8 @@ from __future__ import annotations
 
 import os
 import sys
+import threading
+from collections.abc import Iterator
 
 from dotenv import load_dotenv
 from google import genai
@@ -19,8 +21,29 @@ from common.logger import get_logger
 load_dotenv()
 logger = get_logger(__name__)
 
+# Returned (or yielded) instead of a response once every API key has failed.
+LLM_ERROR_MESSAGE = "Internet error. Please check your connection."
+
+
+class LLMStreamInterrupted(Exception):
+    """Luồng trả lời bị ngắt sau khi đã gửi một phần câu trả lời cho client."""
+
 
 class LLM:
+    # One genai.Client per API key, shared by every LLM instance so that the
+    # sync and async (client.aio) connection pools are reused across calls.
+    _clients = {}
+    _clients_lock = threading.Lock()
+
+    @classmethod
+    def _get_client(cls, api_key: str) -> genai.Client:
+        with cls._clients_lock:
+            client = cls._clients.get(api_key)
+            if client is None:
+                client = genai.Client(api_key=api_key)
+                cls._clients[api_key] = client
+            return client
+
     def __init__(
         self,
         model: str = os.environ["LLM_MODEL"],
@@ -31,9 +54,11 @@ class LLM:
         history: list[dict] = None,
     ):
         self.keys = os.environ["API_KEY"].split(",")
+        # Key that new calls start from; each call rotates its own copy.
         self.api_key_index = 0
+        self._key_lock = threading.Lock()
 
-        self.client = genai.Client(api_key=self.keys[0])
+        self.client = self._get_client(self.keys[0])
         self.model = model
         self.temperature = temperature
         self.top_p = top_p
@@ -43,90 +68,136 @@ class LLM:
     def get_chat(self):
         return self.chat
 
+    def _generation_config(self) -> GenerateContentConfig:
+        return GenerateContentConfig(
+            temperature=self.temperature,
+            system_instruction=self.instructions,
+            candidate_count=1,
+            top_p=self.top_p,
+            top_k=self.top_k,
+            seed=42,
+            max_output_tokens=2048,
+        )
+
+    def _function_calling_config(self, tools: Tool | None) -> GenerateContentConfig:
+        return GenerateContentConfig(
+            temperature=self.temperature,
+            max_output_tokens=2048,
+            tools=[tools],
+            tool_config=ToolConfig(
+                function_calling_config=FunctionCallingConfig(
+                    mode=FunctionCallingConfigMode.ANY
+                )
+            ),
+        )
+
+    def _rotate_key(self, key_index: int, error: Exception) -> int:
+        """
+        Key kế tiếp sau key_index (key mà lời gọi này vừa dùng và bị lỗi).
+        Key dùng chung chỉ được đẩy tiếp nếu nó vẫn là key_index, nên các lời
+        gọi đang chạy song song không làm nhau bỏ qua key.
+        """
+        logger.info(f"API key {self.keys[key_index]} with error {error} failed. Trying next key.")
+        next_index = (key_index + 1) % len(self.keys)
+        with self._key_lock:
+            if self.api_key_index == key_index:
+                self.api_key_index = next_index
+                self.client = self._get_client(self.keys[next_index])
+        return next_index
+
+    def _call_with_rotation(self, call, num_rounds: int = 3):
+        """call(client) với key đang dùng chung, thử lần lượt các key khác khi lỗi."""
+        key_index = self.api_key_index
+        for _ in range(num_rounds * len(self.keys)):
+            try:
+                return call(self._get_client(self.keys[key_index]))
+            except Exception as e:
+                key_index = self._rotate_key(key_index, e)
+        return LLM_ERROR_MESSAGE
+
+    async def _call_with_rotation_async(self, call, num_rounds: int = 3):
+        key_index = self.api_key_index
+        for _ in range(num_rounds * len(self.keys)):
+            try:
+                return await call(self._get_client(self.keys[key_index]).aio)
+            except Exception as e:
+                key_index = self._rotate_key(key_index, e)
+        return LLM_ERROR_MESSAGE
+
     def get_message(
         self,
         prompt: str,
         stream: bool = False,
-    ) -> str | None:
-        num_try = 3
-        while num_try > 0:
+    ) -> str | Iterator[str]:
+        if stream:
+            return self._stream_message(prompt)
+
+        return self._call_with_rotation(
+            lambda client: client.models.generate_content(
+                model=self.model,
+                contents=prompt,
+                config=self._generation_config(),
+            ).text
+        )
+
+    def _stream_message(self, prompt: str, num_rounds: int = 3) -> Iterator[str]:
+        key_index = self.api_key_index
+        for _ in range(num_rounds * len(self.keys)):
+            started = False
             try:
-                if not stream:
-                    response = self.client.models.generate_content(
-                        model=self.model,
-                        contents=prompt,
-                        config=GenerateContentConfig(
-                            temperature=self.temperature,
-                            system_instruction=self.instructions,
-                            candidate_count=1,
-                            top_p=self.top_p,
-                            top_k=self.top_k,
-                            seed=42,
-                            max_output_tokens=2048,
-                        ),
-                    )
-                    return response.text
-                else:
-                    for chunk in self.client.models.generate_content_stream(
-                        model=self.model,
-                        contents=prompt,
-                        config=GenerateContentConfig(
-                            temperature=self.temperature,
-                            system_instruction=self.instructions,
-                            candidate_count=1,
-                            top_p=self.top_p,
-                            top_k=self.top_k,
-                            seed=42,
-                            max_output_tokens=2048,
-                        ),
-                    ):
-                        print(chunk.text)
-                    return
+                client = self._get_client(self.keys[key_index])
+                for chunk in client.models.generate_content_stream(
+                    model=self.model,
+                    contents=prompt,
+                    config=self._generation_config(),
+                ):
+                    if chunk.text:
+                        started = True
+                        yield chunk.text
+                return
             except Exception as e:
-                logger.info(
-                    f"API key {self.keys[self.api_key_index]} with error {e} failed. Trying next key."
-                )
-                self.api_key_index += 1
-                if self.api_key_index >= len(self.keys):
-                    self.api_key_index = 0
-                    num_try -= 1
-                self.client = genai.Client(api_key=self.keys[self.api_key_index])
+                # Chunks already sent to the caller cannot be taken back,
+                # so only retry when the stream failed before the first one.
+                if started:
+                    logger.info(f"Stream interrupted: {e}")
+                    raise LLMStreamInterrupted(str(e)) from e
+                key_index = self._rotate_key(key_index, e)
 
-        return "Internet error. Please check your connection."
+        yield LLM_ERROR_MESSAGE
 
     def function_calling(
         self,
         prompt: str,
         tools: list[Tool] | None = None,
     ) -> str | None:
-        num_try = 3
-        while num_try > 0:
-            try:
-                response = self.client.models.generate_content(
-                    model=self.model,
-                    contents=prompt,
-                    config=GenerateContentConfig(
-                        temperature=self.temperature,
-                        max_output_tokens=2048,
-                        tools=[tools],
-                        tool_config=ToolConfig(
-                            function_calling_config=FunctionCallingConfig(
-                                mode=FunctionCallingConfigMode.ANY
-                            )
-                        ),
-                    ),
-                )
+        return self._call_with_rotation(
+            lambda client: client.models.generate_content(
+                model=self.model,
+                contents=prompt,
+                config=self._function_calling_config(tools),
+            )
+        )
 
-                return response
+    async def get_message_async(self, prompt: str) -> str:
+        async def call(aio):
+            response = await aio.models.generate_content(
+                model=self.model,
+                contents=prompt,
+                config=self._generation_config(),
+            )
+            return response.text
 
-            except Exception as e:
-                logger.info(
-                    f"API key {self.keys[self.api_key_index]} with error {e} failed. Trying next key."
-                )
-                self.api_key_index += 1
-                if self.api_key_index >= len(self.keys):
-                    self.api_key_index = 0
-                    num_try -= 1
-                self.client = genai.Client(api_key=self.keys[self.api_key_index])
+        return await self._call_with_rotation_async(call)
 
-        return "Internet error. Please check your connection."
+    async def function_calling_async(
+        self,
+        prompt: str,
+        tools: list[Tool] | None = None,
+    ):
+        return await self._call_with_rotation_async(
+            lambda aio: aio.models.generate_content(
+                model=self.model,
+                contents=prompt,
+                config=self._function_calling_config(tools),
+            )
+        )
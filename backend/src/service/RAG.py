@@ -6,19 +6,24 @@ import time
 from collections import defaultdict
 
 # Use relative import since graph is in the same service directory
+from .graph.embedding_snapshot import MODEL_PATH
+from .graph.entity_index import ProductEntityIndex
+from .graph.entity_resolver import EntityResolver
 from .graph.graph import Neo4jGraph
+from .graph.graph_snapshot import GraphSnapshot
+from .graph.neighbors import NeighborTable
+from .product_index import ProductNameIndex
 
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 import pandas as pd
-import torch
-import torch.nn.functional as F
+from common.logger import get_logger
 from common.text import TextProcessor
 from dotenv import load_dotenv
 from duckduckgo_search import DDGS
 from model.phone_db import PhoneDB
-from rapidfuzz import process
 
 load_dotenv()
+logger = get_logger(__name__)
 
 
 class RAG:
@@ -28,21 +33,39 @@ class RAG:
         )
 
         self.text_processor = TextProcessor()
-        self.graph = Neo4jGraph()
-
-        self.edge_list = self.graph.get_edge()
-        self.source_nodes = [e[0] for e in self.edge_list]
-        self.node_mapping, _ = self.graph.get_node_mapping_id()
+        self.graph = Neo4jGraph(db=self.db)
+
+        # The exported snapshot avoids scanning Neo4j on every start.
+        if GraphSnapshot.exists():
+            graph_snapshot = GraphSnapshot.load()
+        else:
+            logger.info(
+                "No graph snapshot found, reading the graph from Neo4j "
+                "(export one with `python -m service.graph.graph_snapshot`)"
+            )
+            graph_snapshot = self.graph.get_graph_snapshot()
+        self.edge_list = graph_snapshot.get_edge_list()
+        self.node_mapping, self.reverse_node_mapping = graph_snapshot.get_node_mapping()
+        self.entity_index = ProductEntityIndex()
+        self.entity_resolver = EntityResolver(
+            self.node_mapping,
+            score_cutoff=float(os.environ.get("ENTITY_MATCH_CUTOFF", 0)),
+        )
         self.embeddings_graph_nodes = self.graph.get_all_graph_embeddings(
-            num_nodes=len(self.node_mapping), edge_list=self.edge_list
+            num_nodes=len(self.node_mapping),
+            edge_list=self.edge_list,
+            model_path=MODEL_PATH,
+            node_mapping=self.node_mapping,
+        )
+        self.neighbor_table = NeighborTable.load_or_build(
+            self.embeddings_graph_nodes,
+            k=int(os.environ.get("GRAPH_NEIGHBOR_K", 10)),
         )
-        self.node_embeddings_norm = F.normalize(self.embeddings_graph_nodes, p=2, dim=1)
-        self.edge_lookup = {}
-        for src, tgt, rel in self.edge_list:
-            self.edge_lookup[(src, tgt)] = rel
+        self.adjacency = graph_snapshot.get_adjacency()
 
         self.ddgs = DDGS()
-        self.all_phones = {i["title"]: i["url"] for i in self.db.get_all()}
+        self.product_index = ProductNameIndex(self.db.catalog.title_to_url())
+        self.db.catalog.subscribe(self._rebuild_product_index)
 
     def get_senmatic_search_result(self, query, num_candidates=100, k=20) -> list[str]:
         db_information = self.db.vector_search(
@@ -58,10 +81,26 @@ class RAG:
             query=query, k=senmatic_k
         )
         grouped_result = defaultdict(list)
-        query_infos = []
+
+        # Các sản phẩm đã được index offline không cần gọi LLM trích xuất.
+        matches = set()
+        not_indexed = []
+        for doc in senmatic_search_result:
+            node_names = self.entity_index.lookup(doc)
+            if node_names is None:
+                not_indexed.append(doc)
+                continue
+            matches.update(
+                self.reverse_node_mapping[name]
+                for name in node_names
+                if name in self.reverse_node_mapping
+            )
+
         query_entities = []
-        self.graph.extract_entities_and_relationships(
-            senmatic_search_result, list_output=query_infos
+        query_infos = (
+            self.graph.extract_entities_and_relationships(not_indexed)
+            if not_indexed
+            else []
         )
         for query_info in query_infos:
             if query_info is None or query_info == "":
@@ -69,46 +108,26 @@ class RAG:
             query_entity, _ = self.graph.process_llm_out(query_info)
             if query_entity:
                 query_entities.extend(query_entity)
-        matches = self._find_closest_entities(query_entities, self.node_mapping)
-        if not matches or len(matches) == 0:
-            return "Thông tin bổ sung:\n" + ".\n".join(senmatic_search_result)
-
-        matches = list(
-            set(
-                [
-                    match_id
-                    for _, match_id, _, _ in matches
-                    if match_id in self.node_mapping
-                ]
+        matches.update(
+            match_id
+            for _, match_id, _, _ in self._find_closest_entities(
+                query_entities, self.node_mapping
             )
+            if match_id in self.node_mapping
         )
+        if not matches:
+            return "Thông tin bổ sung:\n" + ".\n".join(senmatic_search_result)
 
-        for match_id in matches:
-            query_embedding = self.embeddings_graph_nodes[match_id]
-            query_embedding = F.normalize(query_embedding, p=2, dim=0)
-
-            similarity_scores = torch.matmul(
-                query_embedding.unsqueeze(0), self.node_embeddings_norm.T
-            ).squeeze()
-
-            top_k_indices = torch.topk(similarity_scores, graph_k).indices
-            for idx in top_k_indices:
-                similar_node_id = idx.item()
-                # Check for direct connection in the edge list
-                direct_connections = []
-                temp = self.edge_lookup.get((match_id, similar_node_id), None)
-                if temp is not None:
-                    direct_connections.append((match_id, similar_node_id, temp))
-                    if match_id in self.source_nodes:
-                        direct_connections.append((match_id, similar_node_id, temp))
-                    else:
-                        direct_connections.append((similar_node_id, match_id, temp))
-                if direct_connections:
-                    for connection in direct_connections:
-                        source = self.node_mapping[connection[0]]
-                        target = self.node_mapping[connection[1]]
-                        relationship = connection[2]
-                        grouped_result[source].append(f"{relationship} {target}")
+        matches = list(matches)
+
+        neighbors = self.neighbor_table.query(matches, graph_k)
+        for match_id, top_k_indices in zip(matches, neighbors.tolist()):
+            for similar_node_id in top_k_indices:
+                # Direct connections between the matched node and its neighbour
+                for relationship in self.adjacency.edge_types(match_id, similar_node_id):
+                    source = self.node_mapping[match_id]
+                    target = self.node_mapping[similar_node_id]
+                    grouped_result[source].append(f"{relationship} {target}")
         graph_search_result = [
             f"{src}: {', '.join(rels)}" for src, rels in grouped_result.items()
         ]
@@ -127,13 +146,12 @@ class RAG:
         Returns:
             list: A list of tuples [(query_entity, closest_match_id, closest_match_name, score)].
         """
-        results = []
-        node_names = list(node_mapping.values())
-        for entity in entities:
-            closest_match, score, index = process.extractOne(entity, node_names)
-            closest_match_id = list(node_mapping.keys())[index]
-            results.append((entity, closest_match_id, closest_match, score))
-        return results
+        resolver = (
+            self.entity_resolver
+            if node_mapping is self.node_mapping
+            else EntityResolver(node_mapping)
+        )
+        return resolver.resolve(entities)
 
     def get_web_search_result(
         self, query: str, max_results: int = 10, num_tries=3
@@ -165,7 +183,13 @@ class RAG:
         return "Thông tin cửa hàng:\n" + ".\n".join(sorted(list(set(loc))))
 
     def get_product_link(self, product_name: str):
-        sim_product = process.extract(product_name, self.all_phones.keys(), limit=3)
+        sim_product = self.product_index.search(product_name, limit=3)
         return "Thông tin bổ sung: \n" + "\n".join(
-            [f"{name} - {self.all_phones[name]}" for name, _, _ in sim_product]
+            [f"{name} - {url}" for name, url, _ in sim_product]
         )
+
+    def _rebuild_product_index(self, catalog):
+        # Runs on the catalog refresh thread; the new index is swapped in whole.
+        title_to_url = catalog.title_to_url()
+        if title_to_url != self.product_index.title_to_url:
+            self.product_index = ProductNameIndex(title_to_url)
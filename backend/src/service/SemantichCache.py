@@ -1,12 +1,21 @@
 from __future__ import annotations
 
 import os
+import threading
+import time
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
 
+import numpy as np
 import pymongo
+from common.logger import get_logger
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = get_logger(__name__)
+
 
 def design_collections(db):
     questions = db[os.environ['COLLECTION_QUES_NAME']]
@@ -28,13 +37,39 @@ def get_mongo_client(mongo_uri):
         return None
 
 
-client = get_mongo_client(os.environ['MONGO_URI'])
-ques, ans = design_collections(client[os.environ['DB_CACHE_NAME']])
+class MongoSemanticCache():
+    """
+    Tier $vectorSearch trên Mongo. Câu hỏi/trả lời hết hạn qua TTL index trên
+    `created_at` và số câu hỏi được giới hạn ở `max_size` (xoá cũ nhất trước).
+    """
 
+    def __init__(self, mongo_uri=None, db_name=None, ttl=86400, max_size=100000):
+        self.client = get_mongo_client(mongo_uri or os.environ['MONGO_URI'])
+        self.db = self.client[db_name or os.environ['DB_CACHE_NAME']]
+        self._ques, self._answer = design_collections(self.db)
+        self.ttl = ttl
+        self.max_size = max_size
+        self.ensure_indexes()
 
-class MongoSemanticCache():
-    def __init__(self):
-        self._ques, self._answer = ques, ans
+    def ensure_indexes(self):
+        # TTL index cần `created_at` kiểu datetime; Mongo tự xoá document hết hạn.
+        for collection in (self._ques, self._answer):
+            collection.create_index(
+                'created_at', expireAfterSeconds=int(self.ttl),
+            )
+        self._answer.create_index('question_id')
+
+    def _enforce_size_cap(self):
+        excess = self._ques.estimated_document_count() - self.max_size
+        if excess <= 0:
+            return
+        oldest = [
+            doc['_id'] for doc in self._ques.find(
+                {}, {'_id': 1},
+            ).sort('created_at', pymongo.ASCENDING).limit(excess)
+        ]
+        self._ques.delete_many({'_id': {'$in': oldest}})
+        self._answer.delete_many({'question_id': {'$in': oldest}})
 
     def insert(self, data):
         question = data['question']  # collection question
@@ -44,32 +79,40 @@ class MongoSemanticCache():
         if not question_embedding:
             return None
 
+        created_at = datetime.now(timezone.utc)
         question_doc = {
             'question': question,
             'embedding': question_embedding,
+            'created_at': created_at,
         }
         question_id = self._ques.insert_one(question_doc).inserted_id
 
         answer_doc = {
             'question_id': question_id,
             'answer': answer,
+            'created_at': created_at,
         }
         self._answer.insert_one(answer_doc)
 
+        self._enforce_size_cap()
         return question_id
 
-    def semantic_search(self, query_embedding, limit=4, threshold=0.94):
+    def semantic_search(
+        self, query_embedding, limit=4, threshold=0.94, max_age=None,
+    ):
 
         if query_embedding is None:
             return 'Invalid query or embedding generation failed.'
 
+        # Document hết hạn chỉ bị TTL monitor xoá sau tối đa ~60s, nên khi lọc
+        # theo max_age thì lấy dư ứng viên để $match không loại hết kết quả.
         vector_search_stage = {
             '$vectorSearch': {
                 'index': 'vector_index',
                 'queryVector': query_embedding,
                 'path': 'embedding',
                 'numCandidates': 400,
-                'limit': limit,
+                'limit': limit if max_age is None else max(limit, 10),
             },
         }
 
@@ -99,10 +142,12 @@ class MongoSemanticCache():
             },
         }
 
-        pipeline = [
-            vector_search_stage,
-            unset_stage, lookup_stage, project_stage,
-        ]
+        pipeline = [vector_search_stage, unset_stage]
+        if max_age is not None:
+            cutoff = datetime.now(timezone.utc) - timedelta(seconds=max_age)
+            pipeline.append({'$match': {'created_at': {'$gte': cutoff}}})
+            pipeline.append({'$limit': limit})
+        pipeline.extend([lookup_stage, project_stage])
 
         results = list(self._ques.aggregate(pipeline))
 
@@ -136,3 +181,170 @@ class MongoSemanticCache():
 
     def drop_collection(self, collection_name):
         self.db[collection_name].drop()
+
+
+class InMemorySemanticCache():
+    """
+    Tier bộ nhớ giữ các câu hỏi/trả lời nóng. Điểm được tính như
+    vectorSearchScore của Atlas với cosine: (1 + cos) / 2.
+    """
+
+    def __init__(self, max_size=1024, ttl=86400):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._matrix = None
+        self._questions = []
+        self._answers = []
+        self._created_at = np.zeros(max_size)
+        self._last_used = np.zeros(max_size)
+
+    def __len__(self):
+        return len(self._questions)
+
+    def _evict_slot(self, now):
+        # Ưu tiên slot đã hết hạn, nếu không thì slot ít được dùng gần đây nhất.
+        size = len(self._questions)
+        expired = np.flatnonzero(now - self._created_at[:size] > self.ttl)
+        if len(expired):
+            return int(expired[0])
+        return int(np.argmin(self._last_used[:size]))
+
+    def insert(self, question, answer, embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return
+        vector = vector / norm
+        now = time.time()
+
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.zeros(
+                    (self.max_size, len(vector)), dtype=np.float32,
+                )
+            if len(self._questions) < self.max_size:
+                slot = len(self._questions)
+                self._questions.append(question)
+                self._answers.append(answer)
+            else:
+                slot = self._evict_slot(now)
+                self._questions[slot] = question
+                self._answers[slot] = answer
+            self._matrix[slot] = vector
+            self._created_at[slot] = now
+            self._last_used[slot] = now
+
+    def semantic_search(self, query_embedding, threshold=0.94):
+        with self._lock:
+            size = len(self._questions)
+            if size == 0:
+                return None
+            vector = np.asarray(query_embedding, dtype=np.float32)
+            norm = np.linalg.norm(vector)
+            if norm == 0:
+                return None
+
+            now = time.time()
+            scores = (1 + self._matrix[:size] @ (vector / norm)) / 2
+            scores[now - self._created_at[:size] > self.ttl] = -1
+            best = int(np.argmax(scores))
+            if scores[best] < threshold:
+                return None
+
+            self._last_used[best] = now
+            return {
+                'question': self._questions[best],
+                'answer': self._answers[best],
+                'score': float(scores[best]),
+            }
+
+    def clear(self):
+        with self._lock:
+            self._matrix = None
+            self._questions = []
+            self._answers = []
+
+
+class SemanticAnswerCache():
+    """
+    Cache câu trả lời theo ngữ nghĩa của câu hỏi độc lập (đã giải quyết lịch
+    sử hội thoại): tier bộ nhớ phía trước tier $vectorSearch của Mongo.
+    """
+
+    def __init__(
+        self,
+        get_embedding,
+        memory_tier=None,
+        mongo_tier=None,
+        threshold=0.94,
+        ttl=86400,
+    ):
+        self.get_embedding = get_embedding
+        if memory_tier is None:
+            memory_tier = InMemorySemanticCache(ttl=ttl)
+        self.memory_tier = memory_tier
+        self.mongo_tier = mongo_tier
+        self.threshold = threshold
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, question):
+        embedding = self.get_embedding(question)
+        if embedding is None or len(embedding) == 0:
+            return None
+
+        result = self.memory_tier.semantic_search(embedding, self.threshold)
+        if result is not None:
+            self.hits += 1
+            return result['answer']
+
+        if self.mongo_tier is not None:
+            try:
+                results = self.mongo_tier.semantic_search(
+                    embedding,
+                    limit=1,
+                    threshold=self.threshold,
+                    max_age=self.ttl,
+                )
+            except Exception as e:
+                logger.warning(f'Semantic cache lookup failed: {e}')
+                results = []
+            if results and results[0]['answers']:
+                answer = results[0]['answers'][0]['answer']
+                # Promote the hit into the in-memory tier.
+                self.memory_tier.insert(
+                    results[0]['question'], answer, embedding,
+                )
+                self.hits += 1
+                return answer
+
+        self.misses += 1
+        return None
+
+    def store(self, question, answer):
+        embedding = self.get_embedding(question)
+        if embedding is None or len(embedding) == 0 or not answer:
+            return
+
+        self.memory_tier.insert(question, answer, embedding)
+        if self.mongo_tier is not None:
+            try:
+                self.mongo_tier.insert(
+                    {
+                        'question': question,
+                        'answer': answer,
+                        'embedding': list(embedding),
+                    },
+                )
+            except Exception as e:
+                logger.warning(f'Semantic cache insert failed: {e}')
+
+    def stats(self):
+        return {
+            'size': len(self.memory_tier),
+            'hits': self.hits,
+            'misses': self.misses,
+            'threshold': self.threshold,
+        }
@@ -0,0 +1,113 @@
+"""
+So sánh bộ nhớ đỉnh và thời gian mỗi epoch của GAE theo chế độ đặc trưng và
+số node, trên đồ thị ngẫu nhiên có bậc trung bình giống đồ thị sản phẩm.
+
+    cd backend/src && python -m service.graph.benchmark_gae --nodes 1000 10000 100000 --modes sparse embedding text
+
+Mỗi cấu hình chạy trong một process riêng để bộ nhớ đỉnh (ru_maxrss) không bị
+cộng dồn. Chế độ text dùng vector ngẫu nhiên cùng số chiều với SBERT.
+"""
+
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+import torch
+import torch.nn.functional as F
+
+# Add the src directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), "../.."))
+
+from service.graph.gae import FEATURE_MODES, GAE, build_node_features, get_input_dim
+
+
+def _run(feature_mode, num_nodes, avg_degree, epochs, text_dim, feature_dim):
+    torch.manual_seed(0)
+    num_edges = int(num_nodes * avg_degree)
+    edge_index = torch.randint(0, num_nodes, (2, num_edges))
+
+    features = build_node_features(
+        feature_mode,
+        num_nodes,
+        node_names=[""] * num_nodes,
+        encode=lambda names: torch.randn(len(names), text_dim),
+    )
+    model = GAE(
+        get_input_dim(feature_mode, features, feature_dim),
+        16,
+        8,
+        feature_mode=feature_mode,
+        num_nodes=num_nodes,
+    )
+    optimizer = torch.optim.Adam(model.parameters(), lr=0.01)
+    target = torch.ones(num_edges)
+
+    times = []
+    for _ in range(epochs):
+        started_at = time.perf_counter()
+        optimizer.zero_grad()
+        _, reconstructed = model(features, edge_index)
+        loss = F.binary_cross_entropy_with_logits(reconstructed, target)
+        loss.backward()
+        optimizer.step()
+        times.append(time.perf_counter() - started_at)
+
+    return {
+        "mode": feature_mode,
+        "nodes": num_nodes,
+        "edges": num_edges,
+        "params": sum(p.numel() for p in model.parameters()),
+        "epoch_time": sum(times) / len(times),
+        # ru_maxrss is reported in KB on Linux.
+        "peak_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--nodes", type=int, nargs="+", default=[1790, 10000, 100000])
+    parser.add_argument("--modes", nargs="+", choices=FEATURE_MODES, default=list(FEATURE_MODES))
+    parser.add_argument("--avg-degree", type=float, default=3.2)
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--text-dim", type=int, default=384)
+    parser.add_argument("--feature-dim", type=int, default=64)
+    parser.add_argument(
+        "--max-identity-nodes",
+        type=int,
+        default=20000,
+        help="Skip the dense identity mode above this many nodes",
+    )
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    print(f"{'mode':<10}{'nodes':>10}{'edges':>10}{'params':>12}{'epoch (s)':>12}{'peak (MB)':>12}")
+    for num_nodes in args.nodes:
+        for feature_mode in args.modes:
+            if feature_mode == "identity" and num_nodes > args.max_identity_nodes:
+                print(f"{feature_mode:<10}{num_nodes:>10}  skipped (dense N x N features)")
+                continue
+            with ctx.Pool(1) as pool:
+                r = pool.apply(
+                    _run,
+                    (
+                        feature_mode,
+                        num_nodes,
+                        args.avg_degree,
+                        args.epochs,
+                        args.text_dim,
+                        args.feature_dim,
+                    ),
+                )
+            print(
+                f"{r['mode']:<10}{r['nodes']:>10}{r['edges']:>10}{r['params']:>12}"
+                f"{r['epoch_time']:>12.4f}{r['peak_mb']:>12.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import numpy as np
+
+
+class CSRGraph:
+    """
+    Đồ thị có hướng lưu dạng CSR theo cả hai chiều (cạnh ra và cạnh vào).
+    Loại quan hệ được mã hoá thành số nguyên, tên nằm trong `relationship_types`.
+    Trong mỗi node, cạnh được sắp theo node kề nên tra cứu cạnh (src, dst) là
+    tìm kiếm nhị phân trên O(bậc) phần tử.
+    """
+
+    def __init__(
+        self,
+        num_nodes: int,
+        src: np.ndarray,
+        dst: np.ndarray,
+        types: np.ndarray,
+        relationship_types: list[str],
+    ):
+        self.num_nodes = num_nodes
+        self.relationship_types = relationship_types
+        self.type_codes = {name: code for code, name in enumerate(relationship_types)}
+
+        self.out_offsets, self.out_targets, self.out_types = self._compress(
+            src, dst, types, num_nodes
+        )
+        self.in_offsets, self.in_sources, self.in_types = self._compress(
+            dst, src, types, num_nodes
+        )
+
+    @classmethod
+    def from_edges(cls, edge_list: list[tuple], num_nodes: int | None = None):
+        """edge_list: [(source_id, target_id, relationship_type)] như `Neo4jGraph.get_edge`."""
+        type_codes = {}
+        src = np.empty(len(edge_list), dtype=np.int64)
+        dst = np.empty(len(edge_list), dtype=np.int64)
+        types = np.empty(len(edge_list), dtype=np.int32)
+        for i, (source, target, relationship) in enumerate(edge_list):
+            src[i] = source
+            dst[i] = target
+            types[i] = type_codes.setdefault(relationship, len(type_codes))
+
+        max_id = int(max(src.max(), dst.max())) + 1 if len(edge_list) else 0
+        num_nodes = max(num_nodes or 0, max_id)
+        return cls(num_nodes, src, dst, types, list(type_codes))
+
+    @staticmethod
+    def _compress(keys, values, types, num_nodes):
+        order = np.lexsort((values, keys))
+        offsets = np.zeros(num_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys, minlength=num_nodes), out=offsets[1:])
+        index_dtype = np.int32 if num_nodes < np.iinfo(np.int32).max else np.int64
+        return offsets, values[order].astype(index_dtype), types[order]
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.out_targets)
+
+    def __contains__(self, node: int) -> bool:
+        return 0 <= node < self.num_nodes
+
+    def out_degree(self, node: int) -> int:
+        return int(self.out_offsets[node + 1] - self.out_offsets[node])
+
+    def in_degree(self, node: int) -> int:
+        return int(self.in_offsets[node + 1] - self.in_offsets[node])
+
+    def out_neighbors(self, node: int) -> np.ndarray:
+        return self.out_targets[self.out_offsets[node] : self.out_offsets[node + 1]]
+
+    def in_neighbors(self, node: int) -> np.ndarray:
+        return self.in_sources[self.in_offsets[node] : self.in_offsets[node + 1]]
+
+    def edge_types(self, src: int, dst: int) -> list[str]:
+        """Tên mọi quan hệ src -> dst (rỗng nếu không có cạnh)."""
+        if src not in self or dst not in self:
+            return []
+        start, end = self.out_offsets[src], self.out_offsets[src + 1]
+        targets = self.out_targets[start:end]
+        lo = np.searchsorted(targets, dst, side="left")
+        hi = np.searchsorted(targets, dst, side="right")
+        return [
+            self.relationship_types[code]
+            for code in self.out_types[start + lo : start + hi]
+        ]
+
+    def edge_type(self, src: int, dst: int) -> str | None:
+        types = self.edge_types(src, dst)
+        return types[0] if types else None
+
+    def k_hop(
+        self,
+        seeds: list[int],
+        hops: int = 1,
+        max_nodes: int | None = None,
+        direction: str = "out",
+    ) -> np.ndarray:
+        """
+        Các node cách seeds tối đa `hops` bước (gồm cả seeds), mở rộng theo
+        từng tầng và dừng khi đạt `max_nodes`.
+
+        Parameters:
+            direction: "out", "in" hoặc "both".
+        """
+        if direction not in ("out", "in", "both"):
+            raise ValueError(f"Unknown direction '{direction}'")
+
+        visited = np.zeros(self.num_nodes, dtype=bool)
+        frontier = np.unique(np.asarray([s for s in seeds if s in self], dtype=np.int64))
+        visited[frontier] = True
+        result = [frontier]
+        total = len(frontier)
+
+        for _ in range(hops):
+            if len(frontier) == 0 or (max_nodes is not None and total >= max_nodes):
+                break
+            parts = []
+            if direction in ("out", "both"):
+                parts.append(self._gather(self.out_offsets, self.out_targets, frontier))
+            if direction in ("in", "both"):
+                parts.append(self._gather(self.in_offsets, self.in_sources, frontier))
+            candidates = np.unique(np.concatenate(parts))
+            frontier = candidates[~visited[candidates]]
+            if max_nodes is not None:
+                frontier = frontier[: max_nodes - total]
+            visited[frontier] = True
+            result.append(frontier)
+            total += len(frontier)
+
+        return np.concatenate(result)
+
+    @staticmethod
+    def _gather(offsets, neighbors, nodes) -> np.ndarray:
+        starts, ends = offsets[nodes], offsets[nodes + 1]
+        lengths = ends - starts
+        if lengths.sum() == 0:
+            return np.empty(0, dtype=np.int64)
+        # Chỉ số phẳng của mọi cạnh thuộc các node trong `nodes`, không vòng lặp Python.
+        flat = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(
+            lengths.sum()
+        )
+        return neighbors[flat].astype(np.int64)
+
+    def nbytes(self) -> int:
+        return sum(
+            array.nbytes
+            for array in (
+                self.out_offsets,
+                self.out_targets,
+                self.out_types,
+                self.in_offsets,
+                self.in_sources,
+                self.in_types,
+            )
+        )
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+
+# Add the src directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), "../.."))
+
+from common.logger import get_logger
+
+logger = get_logger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+MODELS_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "models",
+)
+
+# Shared by training, refresh, graph inference and RAG, so every entry point
+# reads and writes the same checkpoint whatever the working directory.
+MODEL_PATH = os.environ.get(
+    "GCN_MODEL_PATH", os.path.join(MODELS_DIR, "best_gcn_model.pt"),
+)
+
+GRAPH_EMBEDDINGS_PATH = os.environ.get(
+    "GRAPH_EMBEDDINGS_PATH", os.path.join(MODELS_DIR, "graph_embeddings.npy"),
+)
+
+
+def _meta_path(path: str) -> str:
+    return path + ".meta.json"
+
+
+def get_file_checksum(path: str) -> str | None:
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_edges_hash(edge_list: list[tuple]) -> str:
+    """Hash của tập cạnh, không phụ thuộc thứ tự Neo4j trả về."""
+    type_names = sorted({relationship for _, _, relationship in edge_list})
+    type_codes = {name: code for code, name in enumerate(type_names)}
+    edges = np.array(
+        [(src, tgt, type_codes[relationship]) for src, tgt, relationship in edge_list],
+        dtype=np.int64,
+    ).reshape(-1, 3)
+    edges = edges[np.lexsort((edges[:, 2], edges[:, 1], edges[:, 0]))]
+
+    digest = hashlib.sha256()
+    digest.update("\n".join(type_names).encode("utf-8"))
+    digest.update(np.ascontiguousarray(edges).tobytes())
+    return digest.hexdigest()
+
+
+def get_graph_fingerprint(num_nodes: int, edge_list: list[tuple], model_path: str) -> dict:
+    return {
+        "version": SNAPSHOT_VERSION,
+        "num_nodes": num_nodes,
+        "num_edges": len(edge_list),
+        "edges_hash": get_edges_hash(edge_list),
+        "model_checksum": get_file_checksum(model_path),
+    }
+
+
+def load_snapshot(fingerprint: dict, path: str = GRAPH_EMBEDDINGS_PATH) -> np.ndarray | None:
+    """
+    Embedding của các node dạng memory-mapped (chỉ đọc, các worker process
+    dùng chung page cache), hoặc None nếu snapshot không tồn tại hay được tạo
+    từ đồ thị/model khác.
+    """
+    if not (os.path.exists(path) and os.path.exists(_meta_path(path))):
+        return None
+    with open(_meta_path(path), encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("fingerprint") != fingerprint:
+        logger.info(f"Graph embedding snapshot {path} is stale")
+        return None
+
+    embeddings = np.load(path, mmap_mode="r")
+    logger.info(f"Loaded graph embedding snapshot {embeddings.shape} from {path}")
+    return embeddings
+
+
+def save_snapshot(embeddings: np.ndarray, fingerprint: dict, path: str = GRAPH_EMBEDDINGS_PATH):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # Invalidate first and write then rename, so readers never map a half-written
+    # file or pair new embeddings with an old fingerprint.
+    if os.path.exists(_meta_path(path)):
+        os.remove(_meta_path(path))
+    tmp_path = path + ".tmp.npy"
+    np.save(tmp_path, np.ascontiguousarray(embeddings, dtype=np.float32))
+    os.replace(tmp_path, path)
+    with open(_meta_path(path) + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"fingerprint": fingerprint, "shape": list(embeddings.shape)}, f)
+    os.replace(_meta_path(path) + ".tmp", _meta_path(path))
+    logger.info(f"Saved graph embedding snapshot {embeddings.shape} to {path}")
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sys
+
+# Add the src directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), "../.."))
+
+from common.logger import get_logger
+
+logger = get_logger(__name__)
+
+ENTITY_INDEX_PATH = os.environ.get(
+    "ENTITY_INDEX_PATH",
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        "..", "..", "..", "models", "product_entity_index.json",
+    ),
+)
+
+
+def get_content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ProductEntityIndex:
+    """
+    Chỉ mục sản phẩm -> node của đồ thị, tính offline một lần cho mỗi tài
+    liệu catalog. Khoá là hash nội dung của văn bản do
+    `TextProcessor.transform_query` tạo ra, nên tài liệu thay đổi sẽ tự động
+    không khớp (miss) cho tới khi được build lại. Node được lưu theo tên để
+    chỉ mục vẫn dùng được khi id của node thay đổi.
+    """
+
+    def __init__(self, path: str = ENTITY_INDEX_PATH):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.entries = json.load(f)["entries"]
+            logger.info(f"Loaded entity index with {len(self.entries)} products")
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, text: str) -> list[str] | None:
+        """Tên các node của tài liệu, hoặc None nếu tài liệu chưa được index."""
+        entry = self.entries.get(get_content_hash(text))
+        return None if entry is None else entry["nodes"]
+
+    def add(self, text: str, title: str, entities: list[str], nodes: list[str]):
+        self.entries[get_content_hash(text)] = {
+            "title": title,
+            "entities": entities,
+            "nodes": nodes,
+        }
+
+    def reresolve(self, resolve_entities) -> int:
+        """
+        Ánh xạ lại các thực thể đã lưu sang node của đồ thị mới mà không gọi
+        LLM. Trả về số entry có danh sách node thay đổi.
+        """
+        entities = sorted(
+            {entity for entry in self.entries.values() for entity in entry["entities"]}
+        )
+        node_of = {entity: name for entity, _, name, _ in resolve_entities(entities)}
+        changed = 0
+        for entry in self.entries.values():
+            nodes = sorted({node_of[entity] for entity in entry["entities"] if entity in node_of})
+            if nodes != entry["nodes"]:
+                entry["nodes"] = nodes
+                changed += 1
+        return changed
+
+    def retain(self, texts: list[str]) -> int:
+        """Bỏ các entry không còn tương ứng với tài liệu nào trong catalog."""
+        keep = {get_content_hash(text) for text in texts}
+        stale = [key for key in self.entries if key not in keep]
+        for key in stale:
+            del self.entries[key]
+        return len(stale)
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "entries": self.entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+def build_entity_index(
+    graph,
+    resolve_entities,
+    texts: list[str],
+    titles: list[str],
+    index: ProductEntityIndex | None = None,
+    batch_size: int = 32,
+) -> ProductEntityIndex:
+    """
+    Trích xuất thực thể cho các tài liệu chưa có trong chỉ mục và ánh xạ
+    chúng sang node. `resolve_entities(entities)` trả về các tuple
+    (entity, node_id, node_name, score) như `EntityResolver.resolve`.
+    """
+    index = index if index is not None else ProductEntityIndex()
+    todo = [
+        (text, title)
+        for text, title in zip(texts, titles)
+        if text and index.lookup(text) is None
+    ]
+    logger.info(f"{len(todo)} of {len(texts)} documents need entity extraction")
+
+    for start in range(0, len(todo), batch_size):
+        batch = todo[start : start + batch_size]
+        outputs = graph.extract_entities_and_relationships([text for text, _ in batch])
+        for (text, title), output in zip(batch, outputs):
+            if not output:
+                continue
+            entities, _ = graph.process_llm_out(output)
+            nodes = sorted({name for _, _, name, _ in resolve_entities(entities)})
+            index.add(text, title, entities, nodes)
+        index.save()
+        logger.info(f"Indexed {min(start + batch_size, len(todo))}/{len(todo)} documents")
+
+    removed = index.retain(texts)
+    if removed:
+        logger.info(f"Removed {removed} stale products from the entity index")
+    index.save()
+    return index
+
+
+if __name__ == "__main__":
+    from service.RAG import RAG
+
+    rag = RAG()
+    docs = rag.db.get_all()
+    build_entity_index(
+        rag.graph,
+        rag.entity_resolver.resolve,
+        rag.text_processor.transform_query(docs),
+        [doc.get("title", "") for doc in docs],
+        index=rag.entity_index,
+    )
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import unicodedata
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+
+class _StripMarks(dict):
+    """
+    Bảng cho str.translate xoá mọi dấu phụ (category Mn). Mỗi ký tự được tra
+    category ở lần gặp đầu tiên rồi nhớ lại, thay vì quét toàn bộ Unicode khi import.
+    """
+
+    def __missing__(self, code):
+        value = None if unicodedata.category(chr(code)) == "Mn" else code
+        self[code] = value
+        return value
+
+
+_STRIP_MARKS = _StripMarks({ord("đ"): "d", ord("Đ"): "D"})
+
+
+def normalize_name(text: str) -> str:
+    """Bỏ dấu tiếng Việt, chữ thường và gộp khoảng trắng: "Điện Thoại" -> "dien thoai"."""
+    text = unicodedata.normalize("NFD", str(text)).translate(_STRIP_MARKS)
+    return " ".join(text.casefold().split())
+
+
+class EntityResolver:
+    """
+    Ánh xạ tên thực thể sang node của đồ thị. Được build một lần từ
+    node_mapping: tên đã chuẩn hoá, bảng hash cho khớp chính xác và mảng id
+    gọn. Các thực thể không khớp chính xác được chấm điểm trong một lời gọi
+    `rapidfuzz.process.cdist` đa luồng.
+    """
+
+    def __init__(
+        self,
+        node_mapping: dict,
+        scorer=fuzz.WRatio,
+        score_cutoff: float = 0,
+        workers: int = -1,
+        chunk_size: int = 256,
+    ):
+        self.scorer = scorer
+        self.score_cutoff = score_cutoff
+        self.workers = workers
+        self.chunk_size = chunk_size
+
+        self._ids = np.fromiter(node_mapping.keys(), dtype=np.int64, count=len(node_mapping))
+        self._names = list(node_mapping.values())
+        self._normalized = [normalize_name(name) for name in self._names]
+        self._exact = {}
+        for i, name in enumerate(self._normalized):
+            self._exact.setdefault(name, i)
+
+    def __len__(self):
+        return len(self._names)
+
+    def resolve(self, entities: list[str]) -> list[tuple]:
+        """
+        Returns:
+            list: [(query_entity, closest_match_id, closest_match_name, score)],
+            bỏ qua các thực thể có điểm dưới score_cutoff.
+        """
+        if not entities or not self._names:
+            return []
+
+        queries = [normalize_name(entity) for entity in entities]
+        best_index = np.full(len(entities), -1, dtype=np.int64)
+        best_score = np.zeros(len(entities), dtype=np.float32)
+
+        fuzzy = []
+        for i, query in enumerate(queries):
+            index = self._exact.get(query)
+            if index is None:
+                fuzzy.append(i)
+            else:
+                best_index[i] = index
+                best_score[i] = 100
+
+        # Chia theo chunk để ma trận điểm không vượt quá chunk_size x số node.
+        for start in range(0, len(fuzzy), self.chunk_size):
+            rows = fuzzy[start : start + self.chunk_size]
+            scores = process.cdist(
+                [queries[i] for i in rows],
+                self._normalized,
+                scorer=self.scorer,
+                score_cutoff=self.score_cutoff,
+                workers=self.workers,
+                dtype=np.float32,
+            )
+            top = scores.argmax(axis=1)
+            best_index[rows] = top
+            best_score[rows] = scores[np.arange(len(rows)), top]
+
+        return [
+            (
+                entity,
+                int(self._ids[index]),
+                self._names[index],
+                float(score),
+            )
+            for entity, index, score in zip(entities, best_index, best_score)
+            if index >= 0 and score >= self.score_cutoff and score > 0
+        ]
@@ -4,21 +4,86 @@ import torch.nn.functional as F
 # from graph import Neo4jGraph
 from torch_geometric.nn import GCNConv
 
+# identity: one-hot dày (N, N), chỉ dùng được với đồ thị nhỏ.
+# sparse:   one-hot thưa, cùng trọng số với identity nhưng không cấp phát (N, N).
+# embedding: bảng nn.Embedding (N, F) học được, tham số O(N·F).
+# text:     embedding SBERT của tên node (N, D) cố định, tham số lớp đầu O(D·H).
+FEATURE_MODES = ("identity", "sparse", "embedding", "text")
+
+
+def build_node_features(feature_mode, num_nodes, node_names=None, encode=None):
+    """
+    Đầu vào x của GAE cho từng chế độ. Chế độ embedding trả về None vì đặc
+    trưng nằm trong model. Chế độ text cần `encode(list[str]) -> (N, D)`.
+    """
+    if feature_mode == "identity":
+        return torch.eye(num_nodes)  # One-hot encoding for each node
+    if feature_mode == "sparse":
+        indices = torch.arange(num_nodes).repeat(2, 1)
+        return torch.sparse_coo_tensor(
+            indices, torch.ones(num_nodes), (num_nodes, num_nodes)
+        ).coalesce()
+    if feature_mode == "embedding":
+        return None
+    if feature_mode == "text":
+        if node_names is None or encode is None:
+            raise ValueError("Text features need node_names and an encode function")
+        features = torch.as_tensor(encode(node_names), dtype=torch.float32)
+        # One row per node id, or the rows would not line up with edge_index.
+        assert features.size(0) == num_nodes, (
+            f"Text features have {features.size(0)} rows for {num_nodes} nodes"
+        )
+        return features
+    raise ValueError(f"Unknown feature mode '{feature_mode}', expected one of {FEATURE_MODES}")
+
+
+def get_input_dim(feature_mode, features, feature_dim=64):
+    """Số chiều đầu vào của lớp GCN đầu tiên; chế độ embedding dùng feature_dim."""
+    if feature_mode == "embedding":
+        return feature_dim
+    return features.size(1)
+
 
 # Define Graph Autoencoder for Nodes Only
 class GAE(torch.nn.Module):
-    def __init__(self, input_dim, hidden_dim, embedding_dim):
+    def __init__(
+        self,
+        input_dim,
+        hidden_dim,
+        embedding_dim,
+        feature_mode="identity",
+        num_nodes=None,
+    ):
         super(GAE, self).__init__()
+        if feature_mode not in FEATURE_MODES:
+            raise ValueError(
+                f"Unknown feature mode '{feature_mode}', expected one of {FEATURE_MODES}"
+            )
+        self.feature_mode = feature_mode
+        self.config = {
+            "input_dim": input_dim,
+            "hidden_dim": hidden_dim,
+            "embedding_dim": embedding_dim,
+            "feature_mode": feature_mode,
+            "num_nodes": num_nodes,
+        }
+
+        if feature_mode == "embedding":
+            # Learnable node features: (N, F)
+            self.node_embedding = torch.nn.Embedding(num_nodes, input_dim)
         self.encoder1 = GCNConv(
             input_dim, hidden_dim
-        )  # Initializes a GCN layer: (N, N) -> (N, H)
+        )  # Initializes a GCN layer: (N, F_in) -> (N, H)
         self.encoder2 = GCNConv(
             hidden_dim, embedding_dim
         )  # Initializes a GCN layer: (N, H) -> (N, E)
 
-    def encode(self, x, edge_index):
-        # x: (N, N), edge_index: (2, M)
-        x = F.relu(self.encoder1(x, edge_index))  # (N, N) -> (N, H)
+    def encode(self, x, edge_index, n_id=None):
+        # x: (N, F_in) or None in embedding mode, edge_index: (2, M)
+        # n_id: global ids of the rows of a sampled subgraph, (N_sub,)
+        if self.feature_mode == "embedding":
+            x = self.node_embedding.weight if n_id is None else self.node_embedding(n_id)
+        x = F.relu(self.encoder1(x, edge_index))  # (N, F_in) -> (N, H)
         x = self.encoder2(x, edge_index)  # (N, H) -> (N, E)
         return x  # Node embeddings: (N, E)
 
@@ -27,8 +92,58 @@ class GAE(torch.nn.Module):
         src, tgt = edge_index  # src: (M,), tgt: (M,)
         return (z[src] * z[tgt]).sum(dim=1)  # (M, E) -> (M,)
 
-    def forward(self, x, edge_index):
+    def forward(self, x, edge_index, n_id=None):
         # x: (N, F_in), edge_index: (2, M)
-        z = self.encode(x, edge_index)  # Node embeddings: (N, E)
+        z = self.encode(x, edge_index, n_id)  # Node embeddings: (N, E)
         reconstructed = self.decode(z, edge_index)  # Reconstruct edges: (M,)
         return z, reconstructed
+
+    def checkpoint(self):
+        """State dict kèm cấu hình để inference dựng lại đúng chế độ đặc trưng."""
+        return {"config": self.config, "state_dict": self.state_dict()}
+
+    @classmethod
+    def from_checkpoint(cls, checkpoint, num_nodes=None):
+        """Nhận checkpoint của `checkpoint()` hoặc state dict cũ (chế độ identity)."""
+        if "state_dict" not in checkpoint:
+            in_dim, hidden_dim = checkpoint["encoder1.lin.weight"].shape[::-1]
+            embedding_dim = checkpoint["encoder2.lin.weight"].shape[0]
+            model = cls(in_dim, hidden_dim, embedding_dim, num_nodes=num_nodes)
+            model.load_state_dict(checkpoint)
+            return model
+
+        model = cls(**checkpoint["config"])
+        model.load_state_dict(checkpoint["state_dict"])
+        return model
+
+
+def remap_nodes(model, old_names, new_names):
+    """
+    Chuyển model sang tập node mới để fine-tune tiếp (warm start): tham số
+    riêng của từng node được chép theo tên node, node mới giữ khởi tạo ngẫu
+    nhiên. Chế độ text không có tham số theo node nên dùng lại nguyên model.
+    """
+    if model.feature_mode == "text":
+        return model
+
+    config = dict(model.config)
+    config["num_nodes"] = len(new_names)
+    if model.feature_mode in ("identity", "sparse"):
+        config["input_dim"] = len(new_names)
+    new_model = GAE(**config)
+
+    old_index = {name: i for i, name in enumerate(old_names)}
+    kept = [(j, old_index[name]) for j, name in enumerate(new_names) if name in old_index]
+    new_idx = torch.tensor([j for j, _ in kept], dtype=torch.long)
+    old_idx = torch.tensor([i for _, i in kept], dtype=torch.long)
+
+    state = new_model.state_dict()
+    for key, value in model.state_dict().items():
+        if key == "encoder1.lin.weight" and model.feature_mode in ("identity", "sparse"):
+            state[key][:, new_idx] = value[:, old_idx]  # (H, N): one column per node
+        elif key == "node_embedding.weight":
+            state[key][new_idx] = value[old_idx]  # (N, F): one row per node
+        else:
+            state[key] = value
+    new_model.load_state_dict(state)
+    return new_model
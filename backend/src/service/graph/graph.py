@@ -1,9 +1,13 @@
 # Replace with the actual URI, username and password
+import json
 import os
 import random
 import re
 import sys
-from threading import Thread
+import threading
+from collections import defaultdict
+
+import numpy as np
 
 import torch
 
@@ -15,22 +19,36 @@ import warnings
 from common.logger import get_logger
 from common.text import TextProcessor
 from dotenv import load_dotenv
+from infrastructure.worker_pool import llm_pool
 from model.phone_db import PhoneDB
 from neo4j import GraphDatabase
 from service.LLM.llm import LLM
 from service.LLM.PROMPT import extract_entity_relationship_prompt
 from torch_geometric.data import Data
 
-from .gae import GAE  # Use relative import for local gae module
+from .embedding_snapshot import (
+    GRAPH_EMBEDDINGS_PATH,
+    MODEL_PATH,
+    get_graph_fingerprint,
+    load_snapshot,
+    save_snapshot,
+)
+from .gae import (  # Use relative import for local gae module
+    GAE,
+    build_node_features,
+)
+from .graph_snapshot import GraphSnapshot
 
 warnings.filterwarnings("ignore")
 
 load_dotenv()
 logger = get_logger(__name__)
 
+GAE_FEATURE_MODE = os.environ.get("GAE_FEATURE_MODE", "identity")
+
 
 class Neo4jGraph:
-    def __init__(self, uri=None, username=None, password=None):
+    def __init__(self, uri=None, username=None, password=None, db=None):
         if uri is None:
             uri = os.environ.get("AURA_CONNECTION_URI", "neo4j://localhost:7687")
         if username is None:
@@ -38,28 +56,52 @@ class Neo4jGraph:
         if password is None:
             password = os.environ.get("AURA_PASSWORD", "password")
 
-        self.driver = GraphDatabase.driver(uri, auth=(username, password))
+        self._uri = uri
+        self._auth = (username, password)
+        self._driver = None
+        self._driver_lock = threading.Lock()
         self.llm = LLM(temperature=1, top_p=1)
-        self.db = PhoneDB()
+        # Share the caller's PhoneDB (and its catalog store) when given one.
+        self.db = db if db is not None else PhoneDB()
         self.text_processor = TextProcessor()
 
-    def extract_entities_and_relationships(self, text, list_output=None):
-        def add_output(t):
-            list_output.append(self.llm.get_message(t))
-
+    @property
+    def driver(self):
+        # Opened on first use: serving from the graph and embedding snapshots
+        # never needs a Neo4j connection.
+        if self._driver is None:
+            with self._driver_lock:
+                if self._driver is None:
+                    self._driver = GraphDatabase.driver(self._uri, auth=self._auth)
+        return self._driver
+
+    def extract_entities_and_relationships(
+        self, text, list_output=None, timeout=None
+    ):
+        """
+        Với một chuỗi: trả về output của LLM. Với một danh sách: chạy trên
+        pool LLM dùng chung (giới hạn đồng thời toàn process) và trả về list
+        cùng thứ tự với đầu vào, phần tử rỗng/lỗi/quá `timeout` là None.
+        """
         if isinstance(text, str):
             prompt = extract_entity_relationship_prompt(text)
             return self.llm.get_message(prompt)
         elif isinstance(text, list):
-            my_threads = []
-            for t in text:
-                if t is None or t == "":
-                    continue
-                my_thread = Thread(target=add_output, args=(t,))
-                my_thread.start()
-                my_threads.append(my_thread)
-            for my_thread in my_threads:
-                my_thread.join()
+            if timeout is None:
+                timeout = float(os.environ.get("EXTRACTION_TIMEOUT", 30))
+            indices = [i for i, t in enumerate(text) if t]
+            outputs = llm_pool.map(
+                self.extract_entities_and_relationships,
+                [text[i] for i in indices],
+                timeout=timeout,
+            )
+
+            results = [None] * len(text)
+            for i, output in zip(indices, outputs):
+                results[i] = output
+            if list_output is not None:
+                list_output.extend(results)
+            return results
 
     def process_llm_out(self, result):
         response = result
@@ -85,37 +127,195 @@ class Neo4jGraph:
         ]
         return entity_list, relationship_list
 
-    def build_graph(self):
-        list_info = self.text_processor.transform_query(self.db.get_all())
-        logger.info(f"Number of documents to process: {len(list_info)}")
-        count = 0
+    def build_graph(self, restart: bool = False):
+        from .ingest import GraphIngestor
 
-        for doc in list_info:
-            result = self.extract_entities_and_relationships(doc)
-            _, relationship_list = self.process_llm_out(result)
-            self.add_node(relationship_list)
-            count += 1
-            if count % 100 == 0:
-                logger.info(f"Processed {count} documents")
+        return GraphIngestor(self).run(restart=restart)
 
-    def add_node(self, relationships):
+    def ensure_schema(self):
+        # MERGE on Entity.name is a full label scan without this index.
         with self.driver.session() as session:
-            for subject, relation, obj in relationships:
-                session.write_transaction(self._add_node_tx, subject, obj, relation)
+            session.run(
+                "CREATE INDEX entity_name IF NOT EXISTS FOR (n:Entity) ON (n.name)"
+            )
+            session.run(
+                "CREATE CONSTRAINT source_document_id IF NOT EXISTS "
+                "FOR (s:SourceDocument) REQUIRE s.doc_id IS UNIQUE"
+            )
+
+    def add_node(self, relationships):
+        self.add_relationships(
+            [(subject, relation, obj, None) for subject, relation, obj in relationships]
+        )
+
+    def add_relationships(self, relationships, batch_size: int = 1000) -> int:
+        """
+        Ghi các quan hệ theo lô UNWIND, mỗi loại quan hệ một câu Cypher.
 
-    def _add_node_tx(self, tx, subject, object, relation):
+        Parameters:
+            relationships (list): [(subject, relation, object, source_doc)].
+                source_doc (id tài liệu nguồn, có thể None) được thêm vào
+                r.source_docs, và bộ ba được ghi vào node SourceDocument của
+                tài liệu đó để có thể gỡ quan hệ khi tài liệu thay đổi.
+        """
+        grouped = defaultdict(list)
+        doc_triples = defaultdict(list)
+        for subject, relation, obj, source_doc in relationships:
+            relation = relation.replace("`", "")
+            if subject and relation and obj:
+                grouped[relation].append(
+                    {"subject": subject, "object": obj, "source_doc": source_doc}
+                )
+                if source_doc is not None:
+                    doc_triples[source_doc].append(
+                        json.dumps([subject, relation, obj], ensure_ascii=False)
+                    )
+
+        docs = [
+            {"doc_id": doc_id, "triples": list(dict.fromkeys(triples))}
+            for doc_id, triples in doc_triples.items()
+        ]
+        with self.driver.session() as session:
+            for relation, rows in grouped.items():
+                for start in range(0, len(rows), batch_size):
+                    session.execute_write(
+                        self._add_relationships_tx,
+                        relation,
+                        rows[start : start + batch_size],
+                    )
+            for start in range(0, len(docs), batch_size):
+                session.execute_write(self._add_doc_triples_tx, docs[start : start + batch_size])
+        return sum(len(rows) for rows in grouped.values())
+
+    def _add_relationships_tx(self, tx, relation, rows):
         cypher_query = f"""
-            MERGE (a:Entity {{name: $subject}})
-            MERGE (b:Entity {{name: $object}})
-            MERGE (a)-[:`{relation}`]->(b)
+            UNWIND $rows AS row
+            MERGE (a:Entity {{name: row.subject}})
+            MERGE (b:Entity {{name: row.object}})
+            MERGE (a)-[r:`{relation}`]->(b)
+            WITH r, row
+            WHERE row.source_doc IS NOT NULL
+              AND NOT row.source_doc IN coalesce(r.source_docs, [])
+            SET r.source_docs = coalesce(r.source_docs, []) + row.source_doc
         """
+        tx.run(cypher_query, rows=rows)
+
+    def _add_doc_triples_tx(self, tx, docs):
+        # SourceDocument has no relationships, so it never shows up in the
+        # Entity graph, its snapshots or its embeddings.
         tx.run(
-            cypher_query,
-            subject=subject,
-            object=object,
-            relation=relation,
+            """
+            UNWIND $docs AS d
+            MERGE (s:SourceDocument {doc_id: d.doc_id})
+            SET s.triples = coalesce(s.triples, [])
+                + [t IN d.triples WHERE NOT t IN coalesce(s.triples, [])]
+            """,
+            docs=docs,
         )
 
+    def remove_doc_relationships(self, doc_ids) -> int:
+        """
+        Gỡ các tài liệu khỏi r.source_docs của đúng những quan hệ mà chúng đã
+        tạo (tra từ node SourceDocument qua index Entity.name, không quét toàn
+        đồ thị). Quan hệ không còn tài liệu nguồn nào bị xoá, cùng với các
+        node đầu mút của chúng nếu không còn quan hệ nào khác.
+        """
+        doc_ids = [str(doc_id) for doc_id in doc_ids]
+        if not doc_ids:
+            return 0
+        with self.driver.session() as session:
+            deleted = session.execute_write(self._remove_doc_relationships_tx, doc_ids)
+        return deleted
+
+    def _remove_doc_relationships_tx(self, tx, doc_ids):
+        grouped = defaultdict(list)
+        records = tx.run(
+            "MATCH (s:SourceDocument) WHERE s.doc_id IN $doc_ids "
+            "RETURN s.doc_id AS doc_id, s.triples AS triples",
+            doc_ids=doc_ids,
+        )
+        for record in records:
+            for triple in record["triples"] or []:
+                subject, relation, obj = json.loads(triple)
+                grouped[relation].append(
+                    {"subject": subject, "object": obj, "source_doc": record["doc_id"]}
+                )
+
+        deleted, endpoints = 0, set()
+        for relation, rows in grouped.items():
+            record = tx.run(
+                f"""
+                UNWIND $rows AS row
+                MATCH (a:Entity {{name: row.subject}})-[r:`{relation}`]->(b:Entity {{name: row.object}})
+                WHERE row.source_doc IN coalesce(r.source_docs, [])
+                SET r.source_docs = [doc IN r.source_docs WHERE doc <> row.source_doc]
+                WITH DISTINCT r, a, b
+                WHERE size(r.source_docs) = 0
+                DELETE r
+                RETURN count(r) AS deleted, collect(id(a)) + collect(id(b)) AS endpoints
+                """,
+                rows=rows,
+            ).single()
+            deleted += record["deleted"]
+            endpoints.update(record["endpoints"])
+
+        # Only endpoints of deleted relationships can have become orphans.
+        tx.run(
+            """
+            UNWIND $node_ids AS node_id
+            MATCH (n:Entity) WHERE id(n) = node_id AND NOT (n)--()
+            DELETE n
+            """,
+            node_ids=list(endpoints),
+        )
+        tx.run(
+            "MATCH (s:SourceDocument) WHERE s.doc_id IN $doc_ids DELETE s",
+            doc_ids=doc_ids,
+        )
+        return deleted
+
+    def count_untracked_relationships(self) -> int:
+        """Số quan hệ không có source_docs (đồ thị được build trước khi ghi nguồn)."""
+        with self.driver.session() as session:
+            return session.run(
+                "MATCH ()-[r]->() WHERE r.source_docs IS NULL RETURN count(r) AS count"
+            ).single()["count"]
+
+    def has_doc_triples(self) -> bool:
+        with self.driver.session() as session:
+            return session.run("MATCH (s:SourceDocument) RETURN s LIMIT 1").single() is not None
+
+    def backfill_doc_triples(self, batch_size: int = 1000) -> int:
+        """
+        Dựng các node SourceDocument từ r.source_docs cho đồ thị được ghi
+        trước khi có chúng. Quét toàn bộ quan hệ một lần.
+        """
+        doc_triples = defaultdict(list)
+        with self.driver.session() as session:
+            records = session.run(
+                """
+                MATCH (a:Entity)-[r]->(b:Entity)
+                WHERE r.source_docs IS NOT NULL
+                UNWIND r.source_docs AS doc
+                RETURN doc, a.name AS subject, type(r) AS relation, b.name AS object
+                """
+            )
+            for record in records:
+                doc_triples[record["doc"]].append(
+                    json.dumps(
+                        [record["subject"], record["relation"], record["object"]],
+                        ensure_ascii=False,
+                    )
+                )
+            docs = [
+                {"doc_id": doc_id, "triples": triples}
+                for doc_id, triples in doc_triples.items()
+            ]
+            for start in range(0, len(docs), batch_size):
+                session.execute_write(self._add_doc_triples_tx, docs[start : start + batch_size])
+        logger.info(f"Backfilled source triples for {len(docs)} documents")
+        return len(docs)
+
     def extract_content(self, text: str):
         return text.replace("{", "").replace("}", "")
 
@@ -137,10 +337,21 @@ class Neo4jGraph:
             ]
         return edge_list
 
+    def get_graph_snapshot(self) -> GraphSnapshot:
+        """Đồ thị hiện tại trong Neo4j, với id node liên tục 0..N-1."""
+        with self.driver.session() as session:
+            nodes_query = "MATCH (n:Entity) RETURN id(n) AS node_id, n.name AS name"
+            nodes = [
+                (record["node_id"], record["name"]) for record in session.run(nodes_query)
+            ]
+        return GraphSnapshot.from_records(nodes, self.get_edge())
+
     def get_graph_data(self):
-        node_mapping, reverse_node_mapping = self.get_node_mapping_id()
+        # Compact ids, so they can index rows of the feature and embedding matrices.
+        snapshot = self.get_graph_snapshot()
+        node_mapping, reverse_node_mapping = snapshot.get_node_mapping()
         # Get edges and edge types
-        edge_list = self.get_edge()
+        edge_list = snapshot.get_edge_list()
         # Create a mapping from edge names to indices
         edge_name_to_index = {
             name: idx for idx, name in enumerate(set(edge[2] for edge in edge_list))
@@ -157,7 +368,32 @@ class Neo4jGraph:
             edge_name_to_index,
         )
 
-    def get_data_matrix_training(self, training: float = 0.8):
+    def get_node_features(self, feature_mode, num_nodes, node_mapping=None):
+        encode = None
+        node_names = None
+        if feature_mode == "text":
+            from common.text import embedder
+
+            if node_mapping is None:
+                node_mapping, _ = self.get_graph_snapshot().get_node_mapping()
+            # Rows follow node ids, as in edge_index.
+            node_names = [node_mapping.get(i, "") for i in range(num_nodes)]
+
+            def encode(names):
+                # The encoder drops empty strings, so those rows stay zero; node
+                # names also bypass the shared query-embedding cache.
+                rows = [i for i, name in enumerate(names) if name.strip()]
+                features = np.zeros((len(names), embedder.dimension), dtype=np.float32)
+                if rows:
+                    features[rows] = embedder.get_embedding(
+                        [names[i] for i in rows], use_cache=False
+                    )
+                return features
+        return build_node_features(feature_mode, num_nodes, node_names, encode)
+
+    def get_data_matrix_training(
+        self, training: float = 0.8, feature_mode: str = GAE_FEATURE_MODE
+    ):
         (
             node_mapping,
             reverse_node_mapping,
@@ -172,9 +408,8 @@ class Neo4jGraph:
             .contiguous()
         )
 
-        # Features for nodes (one-hot encoding)
-        num_nodes = len(node_mapping)
-        features = torch.eye(num_nodes)  # One-hot encoding for each node
+        # Features for nodes (see FEATURE_MODES in gae.py)
+        features = self.get_node_features(feature_mode, len(node_mapping), node_mapping)
 
         # Split edges into training and validation sets
         num_edges = edge_index.size(1)
@@ -189,21 +424,36 @@ class Neo4jGraph:
         val_edge_index = edge_index[:, val_indices]
 
         # Step 2: Create Data objects for training and validation
-        train_data = Data(x=features, edge_index=train_edge_index)
-        val_data = Data(x=features, edge_index=val_edge_index)
+        num_nodes = len(node_mapping)
+        train_data = Data(x=features, edge_index=train_edge_index, num_nodes=num_nodes)
+        val_data = Data(x=features, edge_index=val_edge_index, num_nodes=num_nodes)
 
         return train_data, val_data, features
 
     def get_all_graph_embeddings(
-        self, num_nodes, edge_list, model_path=r"models/best_gcn_model.pt"
+        self,
+        num_nodes,
+        edge_list,
+        model_path=MODEL_PATH,
+        snapshot_path=GRAPH_EMBEDDINGS_PATH,
+        node_mapping=None,
     ):
-        model = GAE(
-            input_dim=num_nodes,
-            hidden_dim=16,
-            embedding_dim=8,
+        # Inference only runs when the graph or the model changed since the snapshot.
+        fingerprint = get_graph_fingerprint(num_nodes, edge_list, model_path)
+        snapshot = load_snapshot(fingerprint, snapshot_path) if snapshot_path else None
+        if snapshot is not None:
+            return torch.from_numpy(snapshot)
+
+        embeddings = self._infer_graph_embeddings(
+            num_nodes, edge_list, model_path, node_mapping
         )
+        if snapshot_path:
+            save_snapshot(embeddings.numpy(), fingerprint, snapshot_path)
+        return embeddings
 
-        model.load_state_dict(torch.load(model_path))
+    def _infer_graph_embeddings(self, num_nodes, edge_list, model_path, node_mapping=None):
+        # The checkpoint records the feature mode the model was trained with.
+        model = GAE.from_checkpoint(torch.load(model_path), num_nodes=num_nodes)
         model.eval()
 
         edge_index = (
@@ -211,7 +461,10 @@ class Neo4jGraph:
             .t()
             .contiguous()
         )
-        node_features = torch.eye(num_nodes)  # One-hot encoding for each node
+        # Identity checkpoints give the same result with sparse one-hot input,
+        # without allocating a dense (N, N) matrix.
+        feature_mode = "sparse" if model.feature_mode == "identity" else model.feature_mode
+        node_features = self.get_node_features(feature_mode, num_nodes, node_mapping)
 
         with torch.no_grad():
             embeddings, _ = model(node_features, edge_index)
@@ -219,4 +472,6 @@ class Neo4jGraph:
         return embeddings
 
     def close(self):
-        self.driver.close()
+        if self._driver is not None:
+            self._driver.close()
+            self._driver = None
@@ -0,0 +1,214 @@
+"""
+Snapshot offline của đồ thị thực thể để phục vụ không cần quét Neo4j khi khởi động.
+
+    cd backend/src && python -m service.graph.graph_snapshot
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+# Add the src directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), "../.."))
+
+from common.logger import get_logger
+
+from .csr import CSRGraph
+
+logger = get_logger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+GRAPH_SNAPSHOT_DIR = os.environ.get(
+    "GRAPH_SNAPSHOT_DIR",
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        "..", "..", "..", "models", "graph_snapshot",
+    ),
+)
+
+
+class GraphSnapshot:
+    """
+    Đồ thị với id node liên tục 0..N-1, xếp theo thứ tự id Neo4j tăng dần.
+    Lưu dạng cột (.npy, đọc bằng mmap): id Neo4j gốc, tên node (utf-8 nối liền
+    + offsets), cạnh src/dst/type và bảng tên loại quan hệ.
+    """
+
+    def __init__(self, neo4j_ids, names, src, dst, types, relationship_types):
+        self.neo4j_ids = neo4j_ids
+        self.names = names
+        self.src = src
+        self.dst = dst
+        self.types = types
+        self.relationship_types = list(relationship_types)
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.names)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.src)
+
+    @classmethod
+    def from_records(cls, nodes: list[tuple], edges: list[tuple]):
+        """
+        Parameters:
+            nodes (list): [(neo4j_id, name)].
+            edges (list): [(source_neo4j_id, target_neo4j_id, relationship_type)].
+        """
+        nodes = sorted(nodes)
+        neo4j_ids = np.array([node_id for node_id, _ in nodes], dtype=np.int64)
+        names = [name or "" for _, name in nodes]
+
+        type_codes = {}
+        raw = np.array(
+            [
+                (source, target, type_codes.setdefault(rel, len(type_codes)))
+                for source, target, rel in edges
+            ],
+            dtype=np.int64,
+        ).reshape(-1, 3)
+
+        # Edges to nodes outside the node set (e.g. without the Entity label)
+        # have no compact id and are dropped.
+        src = np.searchsorted(neo4j_ids, raw[:, 0])
+        dst = np.searchsorted(neo4j_ids, raw[:, 1])
+        valid = (src < len(neo4j_ids)) & (dst < len(neo4j_ids))
+        valid[valid] &= (neo4j_ids[src[valid]] == raw[valid, 0]) & (
+            neo4j_ids[dst[valid]] == raw[valid, 1]
+        )
+        if not valid.all():
+            logger.info(f"Dropped {(~valid).sum()} edges to nodes outside the graph")
+
+        index_dtype = np.int32 if len(neo4j_ids) < np.iinfo(np.int32).max else np.int64
+        return cls(
+            neo4j_ids,
+            names,
+            src[valid].astype(index_dtype),
+            dst[valid].astype(index_dtype),
+            raw[valid, 2].astype(np.int32),
+            list(type_codes),
+        )
+
+    @classmethod
+    def exists(cls, path: str = GRAPH_SNAPSHOT_DIR) -> bool:
+        return os.path.exists(os.path.join(path, "meta.json"))
+
+    @classmethod
+    def load(cls, path: str = GRAPH_SNAPSHOT_DIR):
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta["version"] != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported graph snapshot version {meta['version']}")
+
+        def column(name):
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+
+        offsets = column("name_offsets")
+        with open(os.path.join(path, "names.bin"), "rb") as f:
+            blob = f.read()
+        names = [
+            blob[offsets[i] : offsets[i + 1]].decode("utf-8")
+            for i in range(len(offsets) - 1)
+        ]
+        snapshot = cls(
+            column("neo4j_ids"),
+            names,
+            column("src"),
+            column("dst"),
+            column("types"),
+            meta["relationship_types"],
+        )
+        logger.info(
+            f"Loaded graph snapshot with {snapshot.num_nodes} nodes and "
+            f"{snapshot.num_edges} edges from {path}"
+        )
+        return snapshot
+
+    def save(self, path: str = GRAPH_SNAPSHOT_DIR):
+        # Written to a temporary directory first so a crash never leaves a
+        # partial snapshot in place.
+        tmp_path = path.rstrip("/") + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        encoded = [name.encode("utf-8") for name in self.names]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(name) for name in encoded], out=offsets[1:])
+        with open(os.path.join(tmp_path, "names.bin"), "wb") as f:
+            f.write(b"".join(encoded))
+
+        for name, array in (
+            ("name_offsets", offsets),
+            ("neo4j_ids", self.neo4j_ids),
+            ("src", self.src),
+            ("dst", self.dst),
+            ("types", self.types),
+        ):
+            np.save(os.path.join(tmp_path, f"{name}.npy"), np.asarray(array))
+        with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": SNAPSHOT_VERSION,
+                    "num_nodes": self.num_nodes,
+                    "num_edges": self.num_edges,
+                    "relationship_types": self.relationship_types,
+                    "created_at": time.time(),
+                },
+                f,
+                ensure_ascii=False,
+            )
+
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+        logger.info(
+            f"Saved graph snapshot with {self.num_nodes} nodes and {self.num_edges} edges to {path}"
+        )
+
+    def get_node_mapping(self):
+        node_mapping = dict(enumerate(self.names))
+        reverse_node_mapping = {name: node_id for node_id, name in node_mapping.items()}
+        return node_mapping, reverse_node_mapping
+
+    def get_edge_list(self) -> list[tuple]:
+        """Cạnh dạng [(source, target, relationship_type)] với id liên tục."""
+        return list(
+            zip(
+                np.asarray(self.src).tolist(),
+                np.asarray(self.dst).tolist(),
+                [self.relationship_types[code] for code in np.asarray(self.types).tolist()],
+            )
+        )
+
+    def get_adjacency(self) -> CSRGraph:
+        return CSRGraph(
+            self.num_nodes,
+            np.asarray(self.src, dtype=np.int64),
+            np.asarray(self.dst, dtype=np.int64),
+            np.asarray(self.types),
+            self.relationship_types,
+        )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from service.graph.graph import Neo4jGraph
+
+    parser = argparse.ArgumentParser(description="Export the entity graph from Neo4j")
+    parser.add_argument("--path", default=GRAPH_SNAPSHOT_DIR)
+    args = parser.parse_args()
+
+    graph = Neo4jGraph()
+    try:
+        graph.get_graph_snapshot().save(args.path)
+    finally:
+        graph.close()
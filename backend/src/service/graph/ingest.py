@@ -0,0 +1,247 @@
+"""
+Xây đồ thị tri thức từ catalog: đọc tài liệu theo cursor, trích xuất thực thể
+song song trên pool LLM và ghi quan hệ theo lô. Tiến độ được lưu vào file
+checkpoint nên chạy lại sẽ tiếp tục từ chỗ đã dừng.
+
+    cd backend/src && python -m service.graph.ingest [--restart]
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+import time
+from itertools import islice
+
+from bson import json_util
+
+# Add the src directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), "../.."))
+
+from common.logger import get_logger
+from common.text import DOCUMENT_FIELDS
+from service.graph.entity_index import get_content_hash
+from service.LLM.llm import LLM_ERROR_MESSAGE
+
+logger = get_logger(__name__)
+
+GRAPH_INGEST_CHECKPOINT = os.environ.get(
+    "GRAPH_INGEST_CHECKPOINT",
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        "..", "..", "..", "models", "graph_ingest_checkpoint.json",
+    ),
+)
+
+DOC_HASHES_PATH = os.environ.get(
+    "DOC_HASHES_PATH",
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        "..", "..", "..", "models", "graph_doc_hashes.json",
+    ),
+)
+
+
+class DocumentHashes(dict):
+    """
+    _id (str) -> hash nội dung của các tài liệu đã có trong đồ thị. Hash được
+    tính trên văn bản do `TextProcessor.transform_query` tạo ra, nên chỉ các
+    trường được đưa vào đồ thị mới làm tài liệu bị coi là thay đổi.
+    """
+
+    def __init__(self, path: str = DOC_HASHES_PATH):
+        super().__init__()
+        self.path = path
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.update(json.load(f))
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self, f)
+        os.replace(tmp_path, self.path)
+
+
+class IngestCheckpoint:
+    """
+    _id của tài liệu cuối cùng đã ghi xong (catalog được duyệt theo _id tăng
+    dần), các tài liệu trích xuất lỗi để thử lại và bộ đếm tổng.
+    """
+
+    def __init__(self, path: str = GRAPH_INGEST_CHECKPOINT):
+        self.path = path
+        self.reset()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                state = json_util.loads(f.read())
+            self.last_id = state["last_id"]
+            self.failed = state["failed"]
+            self.docs = state["docs"]
+            self.triples = state["triples"]
+
+    def reset(self):
+        self.last_id = None
+        self.failed = []
+        self.docs = 0
+        self.triples = 0
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(
+                json_util.dumps(
+                    {
+                        "last_id": self.last_id,
+                        "failed": self.failed,
+                        "docs": self.docs,
+                        "triples": self.triples,
+                    }
+                )
+            )
+        os.replace(tmp_path, self.path)
+
+
+class GraphIngestor:
+    """Pipeline thay cho vòng lặp tuần tự của `Neo4jGraph.build_graph`."""
+
+    def __init__(
+        self,
+        graph,
+        batch_size: int = int(os.environ.get("GRAPH_INGEST_BATCH_SIZE", 32)),
+        write_batch_size: int = 1000,
+        checkpoint_path: str = GRAPH_INGEST_CHECKPOINT,
+        doc_hashes: DocumentHashes | None = None,
+    ):
+        self.graph = graph
+        self.batch_size = batch_size
+        self.write_batch_size = write_batch_size
+        self.checkpoint = IngestCheckpoint(checkpoint_path)
+        self.doc_hashes = doc_hashes if doc_hashes is not None else DocumentHashes()
+
+    def extract(self, docs: list[dict]):
+        """
+        Trích xuất quan hệ cho một lô tài liệu trên pool LLM dùng chung.
+
+        Returns:
+            done (dict): _id -> [(subject, relation, object)] của tài liệu thành công.
+            failed (list): _id của tài liệu lỗi, quá thời gian hoặc hết quota.
+            hashes (dict): _id -> hash nội dung của tài liệu thành công.
+        """
+        texts = self.graph.text_processor.transform_query(docs)
+        outputs = self.graph.extract_entities_and_relationships(texts)
+
+        done, failed, hashes = {}, [], {}
+        for doc, text, output in zip(docs, texts, outputs):
+            if output is None or output == LLM_ERROR_MESSAGE:
+                failed.append(doc["_id"])
+                continue
+            _, relationships = self.graph.process_llm_out(output)
+            done[doc["_id"]] = relationships
+            hashes[doc["_id"]] = get_content_hash(text)
+        return done, failed, hashes
+
+    def write(self, done: dict, hashes: dict) -> int:
+        """Ghi quan hệ của các tài liệu trong `done` và ghi nhận hash của chúng."""
+        written = self.graph.add_relationships(
+            [
+                (subject, relation, obj, str(doc_id))
+                for doc_id, relationships in done.items()
+                for subject, relation, obj in relationships
+            ],
+            batch_size=self.write_batch_size,
+        )
+        for doc_id in done:
+            self.doc_hashes[str(doc_id)] = hashes[doc_id]
+        self.doc_hashes.save()
+        return written
+
+    def run(self, restart: bool = False) -> dict:
+        checkpoint = self.checkpoint
+        if restart:
+            checkpoint.reset()
+        self.graph.ensure_schema()
+
+        started_at = time.perf_counter()
+        docs, triples = 0, 0
+
+        def report(stage):
+            elapsed = max(time.perf_counter() - started_at, 1e-9)
+            logger.info(
+                f"[{stage}] {docs} docs ({docs / elapsed:.2f} docs/sec), "
+                f"{triples} triples ({triples / elapsed:.1f} triples/sec), "
+                f"{len(checkpoint.failed)} failed"
+            )
+
+        # Documents that failed in an earlier run are retried first.
+        if checkpoint.failed:
+            retry = self.graph.db.get_by_ids(checkpoint.failed, projection=DOCUMENT_FIELDS)
+            done, failed, hashes = self.extract(retry)
+            triples += self.write(done, hashes)
+            docs += len(done)
+            checkpoint.failed = failed
+            checkpoint.docs += len(done)
+            checkpoint.triples += triples
+            checkpoint.save()
+            report("retry")
+
+        cursor = self.graph.db.iter_all(
+            after_id=checkpoint.last_id,
+            projection=DOCUMENT_FIELDS,
+            batch_size=self.batch_size,
+        )
+        while True:
+            batch = list(islice(cursor, self.batch_size))
+            if not batch:
+                break
+
+            done, failed, hashes = self.extract(batch)
+            if not done:
+                # Usually quota exhaustion: stop without moving the checkpoint
+                # so the next run starts again from this batch.
+                logger.info("Every document in the batch failed, stopping ingestion")
+                break
+
+            written = self.write(done, hashes)
+            docs += len(done)
+            triples += written
+            checkpoint.last_id = batch[-1]["_id"]
+            checkpoint.failed.extend(failed)
+            checkpoint.docs += len(done)
+            checkpoint.triples += written
+            checkpoint.save()
+            report("ingest")
+
+        report("done")
+        elapsed = time.perf_counter() - started_at
+        return {
+            "docs": docs,
+            "triples": triples,
+            "failed": len(checkpoint.failed),
+            "elapsed": elapsed,
+            "docs_per_sec": docs / elapsed if elapsed else 0.0,
+            "triples_per_sec": triples / elapsed if elapsed else 0.0,
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from service.graph.graph import Neo4jGraph
+
+    parser = argparse.ArgumentParser(description="Build the entity graph from the catalog")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--write-batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    graph = Neo4jGraph()
+    try:
+        GraphIngestor(
+            graph, batch_size=args.batch_size, write_batch_size=args.write_batch_size
+        ).run(restart=args.restart)
+    finally:
+        graph.close()
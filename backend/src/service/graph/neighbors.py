@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+# Add the src directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), "../.."))
+
+from common.logger import get_logger
+
+logger = get_logger(__name__)
+
+NEIGHBOR_TABLE_PATH = os.environ.get(
+    "NEIGHBOR_TABLE_PATH",
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        "..", "..", "..", "models", "graph_neighbors.npy",
+    ),
+)
+
+
+def _scores_path(path: str) -> str:
+    return os.path.splitext(path)[0] + "_scores.npy"
+
+
+def get_embeddings_hash(embeddings: torch.Tensor) -> str:
+    return hashlib.sha256(
+        embeddings.detach().cpu().contiguous().numpy().tobytes()
+    ).hexdigest()
+
+
+class NeighborTable:
+    """
+    Bảng top-k node gần nhất (cosine) của mọi node, tính một lần khi load vì
+    embedding của đồ thị không đổi giữa các lần khởi động. Truy vấn với
+    k <= self.k chỉ là phép gather; k lớn hơn dùng một phép matmul theo lô.
+    """
+
+    def __init__(self, embeddings: torch.Tensor, indices: np.ndarray, scores: np.ndarray):
+        self.embeddings_norm = F.normalize(embeddings, p=2, dim=1)
+        self.indices = indices
+        self.scores = scores
+
+    @property
+    def k(self) -> int:
+        return self.indices.shape[1]
+
+    @classmethod
+    def build(cls, embeddings: torch.Tensor, k: int = 10, chunk_size: int = 4096):
+        embeddings_norm = F.normalize(embeddings, p=2, dim=1)
+        num_nodes = embeddings_norm.size(0)
+        k = min(k, num_nodes)
+
+        indices = np.empty((num_nodes, k), dtype=np.int64)
+        scores = np.empty((num_nodes, k), dtype=np.float32)
+        # Chia theo chunk để ma trận tương đồng tối đa chunk_size x num_nodes.
+        with torch.no_grad():
+            for start in range(0, num_nodes, chunk_size):
+                block = embeddings_norm[start : start + chunk_size] @ embeddings_norm.T
+                top = torch.topk(block, k, dim=1)
+                indices[start : start + chunk_size] = top.indices.cpu().numpy()
+                scores[start : start + chunk_size] = top.values.cpu().numpy()
+        return cls(embeddings, indices, scores)
+
+    @classmethod
+    def load_or_build(
+        cls,
+        embeddings: torch.Tensor,
+        k: int = 10,
+        path: str | None = NEIGHBOR_TABLE_PATH,
+        chunk_size: int = 4096,
+    ):
+        """Dùng bảng đã lưu nếu nó được tính từ đúng các embedding này và đủ k."""
+        embeddings_hash = get_embeddings_hash(embeddings)
+        if path and os.path.exists(path) and os.path.exists(path + ".meta.json"):
+            with open(path + ".meta.json", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("embeddings_hash") == embeddings_hash and meta.get("k", 0) >= min(
+                k, embeddings.size(0)
+            ):
+                indices = np.load(path, mmap_mode="r")
+                scores = np.load(_scores_path(path), mmap_mode="r")
+                logger.info(f"Loaded neighbor table {indices.shape} from {path}")
+                return cls(embeddings, indices, scores)
+
+        table = cls.build(embeddings, k=k, chunk_size=chunk_size)
+        logger.info(f"Built neighbor table {table.indices.shape}")
+        if path:
+            table.save(path, embeddings_hash)
+        return table
+
+    def save(self, path: str, embeddings_hash: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Invalidate first and write then rename, as in save_snapshot: readers
+        # never map a half-written table or pair it with the wrong embeddings.
+        meta_path = path + ".meta.json"
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        for target, array in ((path, self.indices), (_scores_path(path), self.scores)):
+            tmp_path = target + ".tmp.npy"
+            np.save(tmp_path, array)
+            os.replace(tmp_path, target)
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"embeddings_hash": embeddings_hash, "k": self.k}, f)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    def query(self, node_ids: list[int], k: int) -> np.ndarray:
+        """Top-k node gần nhất cho mọi node_ids cùng lúc, shape (len(node_ids), k)."""
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        k = min(k, self.embeddings_norm.size(0))
+        if k <= self.k:
+            return np.asarray(self.indices[node_ids, :k])
+
+        with torch.no_grad():
+            similarity = (
+                self.embeddings_norm[torch.from_numpy(node_ids)] @ self.embeddings_norm.T
+            )
+            return torch.topk(similarity, k, dim=1).indices.cpu().numpy()
@@ -0,0 +1,225 @@
+"""
+Cập nhật đồ thị và embedding khi catalog thay đổi, thay cho build lại toàn bộ:
+chỉ tài liệu mới/đã sửa được trích xuất lại, quan hệ cũ của chúng được thay
+thế, sau đó model GAE được fine-tune vài epoch từ trọng số hiện tại và chỉ
+mục sản phẩm -> node được cập nhật theo đồ thị mới.
+
+    cd backend/src && python -m service.graph.refresh
+    cd backend/src && python -m service.graph.refresh --baseline  # chỉ ghi nhận hash
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import time
+from itertools import islice
+
+import torch
+
+# Add the src directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), "../.."))
+
+from common.logger import get_logger
+from service.graph.embedding_snapshot import MODEL_PATH
+from service.graph.entity_index import (
+    ProductEntityIndex,
+    build_entity_index,
+    get_content_hash,
+)
+from service.graph.entity_resolver import EntityResolver
+from service.graph.gae import GAE, remap_nodes
+from service.graph.graph_snapshot import GRAPH_SNAPSHOT_DIR, GraphSnapshot
+from service.graph.ingest import DocumentHashes, GraphIngestor
+from service.graph.train import train_gcn
+
+logger = get_logger(__name__)
+
+
+def find_changed_documents(db, text_processor, doc_hashes: DocumentHashes):
+    """
+    Returns:
+        changed (list): tài liệu mới hoặc có hash nội dung khác với lần trước.
+        deleted (list): _id (str) của tài liệu đã bị xoá khỏi catalog.
+        hashes (dict): _id (str) -> hash hiện tại của mọi tài liệu.
+    """
+    changed, hashes = [], {}
+    for doc in db.get_all():
+        doc_hash = get_content_hash(text_processor.transform_query([doc])[0])
+        hashes[str(doc["_id"])] = doc_hash
+        if doc_hashes.get(str(doc["_id"])) != doc_hash:
+            changed.append(doc)
+    deleted = [doc_id for doc_id in doc_hashes if doc_id not in hashes]
+    return changed, deleted, hashes
+
+
+def refresh_graph(graph, doc_hashes: DocumentHashes | None = None, batch_size: int = 32) -> dict:
+    doc_hashes = doc_hashes if doc_hashes is not None else DocumentHashes()
+    graph.ensure_schema()
+    if doc_hashes and not graph.has_doc_triples():
+        # Graph ingested before SourceDocument nodes existed.
+        graph.backfill_doc_triples()
+    started_at = time.perf_counter()
+    changed, deleted, _ = find_changed_documents(graph.db, graph.text_processor, doc_hashes)
+    logger.info(f"{len(changed)} new or changed documents, {len(deleted)} deleted")
+
+    removed = 0
+    if deleted:
+        removed += graph.remove_doc_relationships(deleted)
+        for doc_id in deleted:
+            doc_hashes.pop(doc_id, None)
+        doc_hashes.save()
+
+    ingestor = GraphIngestor(graph, batch_size=batch_size, doc_hashes=doc_hashes)
+    docs, triples, failed = 0, 0, 0
+    changed = iter(changed)
+    while batch := list(islice(changed, batch_size)):
+        done, failed_ids, hashes = ingestor.extract(batch)
+        # Old triples are replaced only once the new extraction succeeded, so a
+        # failed document keeps its previous facts and is retried next time.
+        removed += graph.remove_doc_relationships(list(done))
+        triples += ingestor.write(done, hashes)
+        docs += len(done)
+        failed += len(failed_ids)
+
+    elapsed = time.perf_counter() - started_at
+    logger.info(
+        f"Refreshed {docs} documents in {elapsed:.1f}s: {triples} triples written, "
+        f"{removed} stale relationships deleted, {failed} failed"
+    )
+    return {
+        "docs": docs,
+        "deleted_docs": len(deleted),
+        "triples": triples,
+        "removed_relationships": removed,
+        "failed": failed,
+        "changed": docs > 0 or len(deleted) > 0,
+    }
+
+
+def refresh_embeddings(graph, epochs: int = 5, model_path: str = MODEL_PATH):
+    """
+    Cập nhật model GAE cho đồ thị mới: tham số của node cũ được giữ lại theo
+    tên, node mới học trong vài epoch fine-tune. Chế độ text là inductive nên
+    chỉ cần chạy lại forward pass. Snapshot đồ thị và snapshot embedding được
+    ghi lại để lần khởi động sau không phải tính lại.
+
+    Returns:
+        GraphSnapshot: snapshot của đồ thị mới.
+    """
+    new_snapshot = graph.get_graph_snapshot()
+    # The previous snapshot is the only record of which node each model row
+    # belongs to; without it the rows cannot be carried over by name.
+    old_names = GraphSnapshot.load().names if GraphSnapshot.exists() else None
+
+    model = GAE.from_checkpoint(
+        torch.load(model_path), num_nodes=len(old_names) if old_names else None
+    )
+    if model.feature_mode != "text":
+        if old_names is None:
+            raise ValueError(
+                "No previous graph snapshot to map the model's nodes from; run a full "
+                "training (`python -m service.graph.train`) and export the snapshot "
+                "(`python -m service.graph.graph_snapshot`) instead"
+            )
+        model_nodes = model.config["num_nodes"] or model.config["input_dim"]
+        if model_nodes != len(old_names):
+            raise ValueError(
+                f"The model was trained on {model_nodes} nodes but the previous graph "
+                f"snapshot has {len(old_names)}; run a full training instead"
+            )
+
+        model = remap_nodes(model, old_names, new_snapshot.names)
+        train_gcn(
+            epochs=epochs,
+            feature_mode=model.feature_mode,
+            patience=epochs,
+            model_path=model_path,
+            init_model=model,
+        )
+
+    new_snapshot.save(GRAPH_SNAPSHOT_DIR)
+    node_mapping, _ = new_snapshot.get_node_mapping()
+    graph.get_all_graph_embeddings(
+        num_nodes=new_snapshot.num_nodes,
+        edge_list=new_snapshot.get_edge_list(),
+        model_path=model_path,
+        node_mapping=node_mapping,
+    )
+    return new_snapshot
+
+
+def refresh_entity_index(graph, snapshot: GraphSnapshot, index: ProductEntityIndex | None = None):
+    """
+    Đưa chỉ mục sản phẩm -> node về đồ thị mới: entry cũ được ánh xạ lại theo
+    tên node mới (không gọi LLM), sản phẩm mới/đã sửa được trích xuất lại và
+    entry của sản phẩm đã sửa/xoá bị bỏ.
+    """
+    index = index if index is not None else ProductEntityIndex()
+    if not len(index):
+        logger.info(
+            "No entity index to refresh; build one with `python -m service.graph.entity_index`"
+        )
+        return index
+
+    node_mapping, _ = snapshot.get_node_mapping()
+    resolver = EntityResolver(
+        node_mapping,
+        score_cutoff=float(os.environ.get("ENTITY_MATCH_CUTOFF", 0)),
+    )
+    remapped = index.reresolve(resolver.resolve)
+    logger.info(f"Re-resolved {remapped} entity index entries against the new graph")
+
+    docs = graph.db.get_all()
+    return build_entity_index(
+        graph,
+        resolver.resolve,
+        graph.text_processor.transform_query(docs),
+        [doc.get("title", "") for doc in docs],
+        index=index,
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from service.graph.graph import Neo4jGraph
+
+    parser = argparse.ArgumentParser(description="Refresh the entity graph after catalog changes")
+    parser.add_argument(
+        "--baseline",
+        action="store_true",
+        help="Record the current content hashes without re-extracting (graph is up to date "
+        "and every relationship records its source documents)",
+    )
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--fine-tune-epochs", type=int, default=5)
+    parser.add_argument("--skip-embeddings", action="store_true")
+    args = parser.parse_args()
+
+    graph = Neo4jGraph()
+    try:
+        doc_hashes = DocumentHashes()
+        if args.baseline:
+            untracked = graph.count_untracked_relationships()
+            if untracked:
+                # Their facts could never be replaced when a product changes.
+                raise SystemExit(
+                    f"{untracked} relationships have no source documents; rebuild the "
+                    "graph on an empty database with `python -m service.graph.ingest "
+                    "--restart` instead of recording a baseline"
+                )
+            graph.ensure_schema()
+            graph.backfill_doc_triples()
+            _, _, hashes = find_changed_documents(graph.db, graph.text_processor, doc_hashes)
+            doc_hashes.clear()
+            doc_hashes.update(hashes)
+            doc_hashes.save()
+            logger.info(f"Recorded content hashes for {len(hashes)} documents")
+        else:
+            result = refresh_graph(graph, doc_hashes, batch_size=args.batch_size)
+            if result["changed"] and not args.skip_embeddings:
+                snapshot = refresh_embeddings(graph, epochs=args.fine_tune_epochs)
+                refresh_entity_index(graph, snapshot)
+    finally:
+        graph.close()
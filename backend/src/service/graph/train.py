@@ -1,62 +1,312 @@
+"""
+Huấn luyện GAE theo mini-batch cạnh với lấy mẫu láng giềng và negative sampling.
+
+    cd backend/src && python -m service.graph.train --threads 8 --feature-mode sparse
+"""
+
+import argparse
+import os
+import random
+import resource
+import sys
+import time
+
+import numpy as np
 import torch
 import torch.nn.functional as F
-from gae import GAE
 
-# from graph import Neo4jGraph
-from graph import Neo4jGraph
+# Add the src directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), "../.."))
 
 from common.logger import get_logger
+from service.graph.csr import CSRGraph
+from service.graph.embedding_snapshot import MODEL_PATH, MODELS_DIR
+from service.graph.gae import FEATURE_MODES, GAE, get_input_dim
+from service.graph.graph import GAE_FEATURE_MODE, Neo4jGraph
 
 logger = get_logger("TRAINING GCN")
 
+CHECKPOINT_PATH = os.path.join(MODELS_DIR, "gae_checkpoint.pt")
+
+
+def sample_subgraph(csr, seeds, fanouts, rng):
+    """
+    Lấy mẫu tối đa fanouts[i] láng giềng vào (nguồn của cạnh tới node) ở tầng
+    thứ i, đủ cho GCN len(fanouts) lớp tính embedding của seeds.
+
+    Returns:
+        n_id (np.ndarray): id toàn cục của các node trong subgraph, đã sắp xếp.
+        edge_index (torch.Tensor): cạnh của subgraph theo chỉ số cục bộ, (2, M_sub).
+    """
+    nodes = np.unique(seeds)
+    frontier = nodes
+    src_parts, dst_parts = [], []
+    for fanout in fanouts:
+        if len(frontier) == 0:
+            break
+        starts = csr.in_offsets[frontier]
+        degrees = csr.in_offsets[frontier + 1] - starts
+        take = np.minimum(degrees, fanout)
+        # Chọn ngẫu nhiên (có lặp) vị trí trong hàng CSR của từng node, sau đó bỏ trùng.
+        positions = np.repeat(starts, take) + (
+            rng.random(take.sum()) * np.repeat(degrees, take)
+        ).astype(np.int64)
+        src = csr.in_sources[positions].astype(np.int64)
+        src_parts.append(src)
+        dst_parts.append(np.repeat(frontier, take))
+
+        frontier = np.setdiff1d(np.unique(src), nodes, assume_unique=True)
+        nodes = np.union1d(nodes, frontier)
+
+    n_id = nodes
+    if not src_parts:
+        return n_id, torch.empty((2, 0), dtype=torch.long)
+    keys = np.unique(
+        np.concatenate(src_parts) * csr.num_nodes + np.concatenate(dst_parts)
+    )
+    edge_index = np.searchsorted(
+        n_id, np.stack([keys // csr.num_nodes, keys % csr.num_nodes])
+    )
+    return n_id, torch.from_numpy(edge_index)
+
+
+def negative_sampling(pos_edges, num_nodes, edge_keys, rng):
+    """
+    Mỗi cạnh dương (u, v) sinh một cạnh âm (u, w) với w ngẫu nhiên. Các cặp
+    trùng cạnh thật (tra trong edge_keys đã sắp xếp) được lấy mẫu lại một lần.
+    """
+    src = pos_edges[0]
+    dst = rng.integers(0, num_nodes, len(src))
+    for _ in range(2 if len(edge_keys) else 0):
+        keys = src * num_nodes + dst
+        positions = np.minimum(np.searchsorted(edge_keys, keys), len(edge_keys) - 1)
+        collide = edge_keys[positions] == keys
+        if not collide.any():
+            break
+        dst[collide] = rng.integers(0, num_nodes, collide.sum())
+    return np.stack([src, dst])
+
+
+def run_epoch(
+    model,
+    optimizer,
+    features,
+    csr,
+    pos_edges,
+    edge_keys,
+    batch_size,
+    fanouts,
+    rng,
+    train=True,
+):
+    """Một lượt qua pos_edges, trả về loss trung bình; train=False chỉ tính loss."""
+    model.train(train)
+    num_edges = pos_edges.shape[1]
+    order = rng.permutation(num_edges) if train else np.arange(num_edges)
+    total_loss = 0.0
+
+    for start in range(0, num_edges, batch_size):
+        pos = pos_edges[:, order[start : start + batch_size]]
+        neg = negative_sampling(pos, csr.num_nodes, edge_keys, rng)
+        pairs = np.concatenate([pos, neg], axis=1)
+
+        n_id, edge_index = sample_subgraph(csr, pairs.ravel(), fanouts, rng)
+        n_id_tensor = torch.from_numpy(n_id)
+        x = None if features is None else features.index_select(0, n_id_tensor)
+        labels = torch.cat([torch.ones(pos.shape[1]), torch.zeros(neg.shape[1])])
+
+        with torch.set_grad_enabled(train):
+            z = model.encode(x, edge_index, n_id=n_id_tensor)
+            logits = model.decode(z, torch.from_numpy(np.searchsorted(n_id, pairs)))
+            loss = F.binary_cross_entropy_with_logits(logits, labels)
+        if train:
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+        total_loss += loss.item() * pos.shape[1]
+
+    return total_loss / max(num_edges, 1)
+
+
+def peak_memory_mb():
+    # ru_maxrss is reported in KB on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
 
-def train_gcn(epochs=500, lr=0.01, hidden_dim=16, embedding_dim=8):
-    train_data, val_data, features = Neo4jGraph().get_data_matrix_training(training=0.8)
-    print(train_data.x)
-    print(train_data.edge_index)
-    # Initialize the model
-    input_dim = features.size(1)
-    model = GAE(input_dim, hidden_dim, embedding_dim)
 
-    # Define optimizer and loss function
-    optimizer = torch.optim.Adam(model.parameters(), lr=lr)
+def train_gcn(
+    epochs=100,
+    lr=0.01,
+    hidden_dim=16,
+    embedding_dim=8,
+    feature_mode=GAE_FEATURE_MODE,
+    feature_dim=64,
+    batch_size=4096,
+    fanouts=(10, 5),
+    num_threads=None,
+    patience=10,
+    model_path=MODEL_PATH,
+    checkpoint_path=CHECKPOINT_PATH,
+    resume=False,
+    seed=42,
+    init_model=None,
+):
+    """init_model: model đã huấn luyện để fine-tune tiếp (xem gae.remap_nodes)."""
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    # The seed also fixes the train/validation edge split, so a resumed run
+    # validates on the same edges.
+    random.seed(seed)
+    torch.manual_seed(seed)
+    rng = np.random.default_rng(seed)
 
-    def loss_function(reconstructed, edge_index):
-        # Binary cross-entropy loss for adjacency reconstruction
-        # Một tensor toàn giá trị 1 với chiều dài bằng số lượng edges (M) trong đồ thị.
-        target = torch.ones(edge_index.size(1))  # All edges exist
-        # Sự khác biệt giữa logits dự đoán (reconstructed) và các giá trị thực (target).
-        return F.binary_cross_entropy_with_logits(reconstructed, target)
+    train_data, val_data, features = Neo4jGraph().get_data_matrix_training(
+        training=0.8, feature_mode=feature_mode
+    )
+    num_nodes = train_data.num_nodes
+    train_edges = train_data.edge_index.numpy()
+    val_edges = val_data.edge_index.numpy()
+    all_edges = np.concatenate([train_edges, val_edges], axis=1)
+    edge_keys = np.unique(all_edges[0] * num_nodes + all_edges[1])
 
-    # Train the model and validate after each epoch
-    model.train()
+    # Messages only flow along training edges; validation edges stay unseen.
+    csr = CSRGraph(
+        num_nodes,
+        train_edges[0],
+        train_edges[1],
+        np.zeros(train_edges.shape[1], dtype=np.int32),
+        ["EDGE"],
+    )
+    logger.info(
+        f"{num_nodes} nodes, {train_edges.shape[1]} train / {val_edges.shape[1]} "
+        f"validation edges, feature mode {feature_mode}, {torch.get_num_threads()} threads"
+    )
+
+    start_epoch = 0
     min_val_loss = float("inf")
-    for epoch in range(epochs):
-        # Training phase
-        optimizer.zero_grad()
-        embeddings, reconstructed = model(train_data.x, train_data.edge_index)
-        train_loss = loss_function(reconstructed, train_data.edge_index)
-        train_loss.backward()
-        optimizer.step()
-
-        # Validation phase
-        model.eval()
-        with torch.no_grad():
-            val_embeddings, val_reconstructed = model(val_data.x, val_data.edge_index)
-            val_loss = loss_function(val_reconstructed, val_data.edge_index)
+    bad_epochs = 0
+    if resume and os.path.exists(checkpoint_path):
+        state = torch.load(checkpoint_path)
+        model = GAE.from_checkpoint(state["model"])
+        if model.feature_mode != feature_mode:
+            raise ValueError(
+                f"Checkpoint was trained with feature mode '{model.feature_mode}', "
+                f"not '{feature_mode}'"
+            )
+        optimizer = torch.optim.Adam(model.parameters(), lr=lr)
+        optimizer.load_state_dict(state["optimizer"])
+        start_epoch = state["epoch"]
+        min_val_loss = state["min_val_loss"]
+        bad_epochs = state["bad_epochs"]
+        logger.info(f"Resumed from {checkpoint_path} at epoch {start_epoch}")
+    elif init_model is not None:
+        model = init_model
+        if model.feature_mode != feature_mode:
+            raise ValueError(
+                f"Initial model uses feature mode '{model.feature_mode}', not '{feature_mode}'"
+            )
+        optimizer = torch.optim.Adam(model.parameters(), lr=lr)
+    else:
+        model = GAE(
+            get_input_dim(feature_mode, features, feature_dim),
+            hidden_dim,
+            embedding_dim,
+            feature_mode=feature_mode,
+            num_nodes=num_nodes,
+        )
+        optimizer = torch.optim.Adam(model.parameters(), lr=lr)
+
+    os.makedirs(os.path.dirname(os.path.abspath(model_path)), exist_ok=True)
+    os.makedirs(os.path.dirname(os.path.abspath(checkpoint_path)), exist_ok=True)
+
+    for epoch in range(start_epoch, epochs):
+        started_at = time.perf_counter()
+        train_loss = run_epoch(
+            model, optimizer, features, csr, train_edges, edge_keys, batch_size, fanouts, rng
+        )
+        train_time = time.perf_counter() - started_at
+        val_loss = run_epoch(
+            model,
+            None,
+            features,
+            csr,
+            val_edges,
+            edge_keys,
+            batch_size,
+            fanouts,
+            rng,
+            train=False,
+        )
 
         if val_loss < min_val_loss:
             min_val_loss = val_loss
+            bad_epochs = 0
             # Save the model if validation loss improves
-            torch.save(model.state_dict(), "best_gcn_model.pt")
-            logger.info(
-                f"Model saved at epoch {epoch + 1} with validation loss: {val_loss.item()}"
-            )
+            torch.save(model.checkpoint(), model_path)
+            logger.info(f"Model saved at epoch {epoch + 1} with validation loss: {val_loss}")
+        else:
+            bad_epochs += 1
 
-        # Switch back to train mode for next epoch
-        model.train()
+        torch.save(
+            {
+                "model": model.checkpoint(),
+                "optimizer": optimizer.state_dict(),
+                "epoch": epoch + 1,
+                "min_val_loss": min_val_loss,
+                "bad_epochs": bad_epochs,
+            },
+            checkpoint_path,
+        )
 
-        # Print losses
         logger.info(
-            f"Epoch {epoch + 1}, Train Loss: {train_loss.item()}, Validation Loss: {val_loss.item()}"
+            f"Epoch {epoch + 1}, Train Loss: {train_loss:.4f}, Validation Loss: {val_loss:.4f}, "
+            f"time: {train_time:.2f}s, edges/sec: {train_edges.shape[1] / train_time:.0f}, "
+            f"peak memory: {peak_memory_mb():.0f}MB"
         )
+
+        if bad_epochs >= patience:
+            logger.info(f"Early stopping at epoch {epoch + 1}, best validation loss: {min_val_loss}")
+            break
+
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the graph autoencoder")
+    parser.add_argument("--epochs", type=int, default=100)
+    parser.add_argument("--lr", type=float, default=0.01)
+    parser.add_argument("--hidden-dim", type=int, default=16)
+    parser.add_argument("--embedding-dim", type=int, default=8)
+    parser.add_argument("--feature-mode", choices=FEATURE_MODES, default=GAE_FEATURE_MODE)
+    parser.add_argument("--feature-dim", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=4096, help="Positive edges per batch")
+    parser.add_argument(
+        "--fanouts", type=int, nargs="+", default=[10, 5], help="Neighbours sampled per layer"
+    )
+    parser.add_argument("--threads", type=int, default=os.cpu_count())
+    parser.add_argument("--patience", type=int, default=10)
+    parser.add_argument("--model-path", default=MODEL_PATH)
+    parser.add_argument("--checkpoint-path", default=CHECKPOINT_PATH)
+    parser.add_argument("--resume", action="store_true")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    train_gcn(
+        epochs=args.epochs,
+        lr=args.lr,
+        hidden_dim=args.hidden_dim,
+        embedding_dim=args.embedding_dim,
+        feature_mode=args.feature_mode,
+        feature_dim=args.feature_dim,
+        batch_size=args.batch_size,
+        fanouts=args.fanouts,
+        num_threads=args.threads,
+        patience=args.patience,
+        model_path=args.model_path,
+        checkpoint_path=args.checkpoint_path,
+        resume=args.resume,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    main()
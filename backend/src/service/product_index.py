@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import re
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+from .graph.entity_resolver import normalize_name
+
+# "256 GB", "256gb" và "1 TB" đều thành một token dung lượng: "256gb", "1tb".
+_STORAGE_RE = re.compile(r"\b(\d+)\s*(gb|tb)\b")
+_STORAGE_TOKEN_RE = re.compile(r"^\d+(gb|tb)$")
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_PIECE_RE = re.compile(r"[a-z]+|\d+")
+
+
+def tokenize_product_name(text: str) -> list[str]:
+    """Token đã chuẩn hoá: "iPhone 15 Pro Max 256 GB" -> ["iphone", "15", "pro", "max", "256gb"]."""
+    return _TOKEN_RE.findall(_STORAGE_RE.sub(r"\1\2", normalize_name(text)))
+
+
+def _base_name(tokens: list[str]) -> str:
+    """Tên model không kèm dung lượng, dùng làm alias cho mọi phiên bản."""
+    return " ".join(token for token in tokens if not _STORAGE_TOKEN_RE.match(token))
+
+
+class ProductNameIndex:
+    """
+    Tra cứu link sản phẩm theo tên, build một lần từ {title: url} của catalog.
+    Thứ tự: khớp chính xác tên đã chuẩn hoá, khớp alias (tên bỏ dung lượng),
+    rồi chấm điểm fuzzy chỉ trên các ứng viên lấy từ inverted index token
+    hãng/model thay vì toàn bộ catalog.
+    """
+
+    def __init__(
+        self,
+        title_to_url: dict,
+        scorer=fuzz.WRatio,
+        max_candidates: int = 200,
+        typo_cutoff: float = 80,
+    ):
+        self.scorer = scorer
+        self.max_candidates = max_candidates
+        self.typo_cutoff = typo_cutoff
+
+        self.title_to_url = title_to_url
+        self.titles = list(title_to_url)
+        self.urls = [title_to_url[title] for title in self.titles]
+        tokens = [tokenize_product_name(title) for title in self.titles]
+        self._normalized = [" ".join(row_tokens) for row_tokens in tokens]
+
+        self._exact = {}
+        self._aliases = {}
+        postings = {}
+        for row, row_tokens in enumerate(tokens):
+            self._exact.setdefault(self._normalized[row], row)
+            self._aliases.setdefault(_base_name(row_tokens), []).append(row)
+            for token in set(row_tokens):
+                postings.setdefault(token, []).append(row)
+
+        # Danh sách hàng của mỗi token, tăng dần để giao bằng searchsorted.
+        self._postings = {
+            token: np.array(rows, dtype=np.int32) for token, rows in postings.items()
+        }
+        self._vocabulary = list(self._postings)
+        # Tie-break for candidates matching as many query tokens: shorter titles first.
+        self._num_tokens = np.array([len(row_tokens) for row_tokens in tokens], dtype=np.int64)
+        self._max_tokens = int(self._num_tokens.max(initial=0))
+
+    def __len__(self):
+        return len(self.titles)
+
+    def _query_tokens(self, tokens: list[str]) -> list[str]:
+        """Token của truy vấn có trong index; token lạ được tách hoặc sửa lỗi gõ."""
+        known = []
+        for token in tokens:
+            if token in self._postings:
+                known.append(token)
+                continue
+            # "iphone15" -> "iphone", "15".
+            pieces = _PIECE_RE.findall(token)
+            if len(pieces) > 1 and all(piece in self._postings for piece in pieces):
+                known.extend(pieces)
+                continue
+            # "iphnoe" -> "iphone"; chỉ quét từ vựng (nhỏ hơn nhiều so với catalog).
+            if len(token) >= 3:
+                match = process.extractOne(
+                    token,
+                    self._vocabulary,
+                    scorer=fuzz.ratio,
+                    score_cutoff=self.typo_cutoff,
+                )
+                if match is not None:
+                    known.append(match[0])
+        return list(dict.fromkeys(known))
+
+    def _candidates(self, tokens: list[str], limit: int) -> np.ndarray:
+        """
+        Các hàng chứa nhiều token của truy vấn nhất. Danh sách hàng được giao
+        lần lượt từ token hiếm nhất, bỏ qua token làm còn ít hơn `limit` hàng;
+        token hiếm đến mức có ít hơn `limit` hàng thì các hàng đó được giữ
+        nguyên làm ứng viên.
+        """
+        tokens = sorted(self._query_tokens(tokens), key=lambda token: len(self._postings[token]))
+        parts, rows, skipped = [], None, []
+        for token in tokens:
+            postings = self._postings[token]
+            if rows is None:
+                if len(postings) < limit:
+                    parts.append(postings)
+                    skipped.append(token)
+                else:
+                    rows = postings
+                continue
+            positions = np.minimum(np.searchsorted(postings, rows), len(postings) - 1)
+            narrowed = rows[postings[positions] == rows]
+            if len(narrowed) >= limit:
+                rows = narrowed
+            else:
+                skipped.append(token)
+        if rows is not None:
+            parts.append(self._top_rows(rows, skipped))
+        if not parts:
+            return np.empty(0, dtype=np.int32)
+        return np.unique(np.concatenate(parts))
+
+    def _top_rows(self, rows: np.ndarray, skipped: list[str]) -> np.ndarray:
+        """
+        max_candidates hàng khớp nhiều token của truy vấn nhất. Mọi hàng trong
+        `rows` đã chứa các token được giao, nên chỉ cần đếm các token bị bỏ qua.
+        """
+        if len(rows) <= self.max_candidates:
+            return rows
+        matched = np.zeros(len(rows), dtype=np.int64)
+        for token in skipped:
+            postings = self._postings[token]
+            positions = np.minimum(np.searchsorted(postings, rows), len(postings) - 1)
+            matched += postings[positions] == rows
+        # More matched tokens first, then fewer tokens in the title.
+        key = matched * (self._max_tokens + 1) - self._num_tokens[rows]
+        return rows[np.argpartition(-key, self.max_candidates - 1)[: self.max_candidates]]
+
+    def search(self, product_name: str, limit: int = 3) -> list[tuple]:
+        """
+        Returns:
+            list: [(title, url, score)] của tối đa `limit` sản phẩm gần nhất.
+        """
+        tokens = tokenize_product_name(product_name)
+        if not tokens or not self.titles:
+            return []
+
+        query = " ".join(tokens)
+        matches = {}
+
+        row = self._exact.get(query)
+        if row is not None:
+            matches[row] = 100.0
+        for row in self._aliases.get(_base_name(tokens), []):
+            matches.setdefault(row, 100.0)
+
+        if len(matches) < limit:
+            # Truy vấn không chung token nào với catalog thì không có ứng viên.
+            candidates = self._candidates(tokens, limit)
+            scored = process.extract(
+                query,
+                [self._normalized[row] for row in candidates],
+                scorer=self.scorer,
+                limit=limit + len(matches),
+            )
+            for _, score, i in scored:
+                matches.setdefault(int(candidates[i]), float(score))
+
+        best = sorted(matches.items(), key=lambda item: -item[1])[:limit]
+        return [(self.titles[row], self.urls[row], score) for row, score in best]
@@ -1,51 +1,110 @@
 from __future__ import annotations
 
+import argparse
+import hashlib
 import json
 import os
+import re
 
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+from common.logger import get_logger
+from dotenv import load_dotenv
+from infrastructure.embedding_service import embedding_service
 
-embedding_model = SentenceTransformer('keepitreal/vietnamese-sbert')
+logger = get_logger(__name__)
+
+
+# Removed from every text before encoding, in a single regex pass.
+_CLEANUP_PATTERN = re.compile(r'###|<br>|\n')
 
 
 class Embedding:
     def __init__(
         self,
         embedding_model: str,
+        batch_size: int = 64,
+        cache=None,
     ):
-        self.model = SentenceTransformer(embedding_model)
+        self.model_name = embedding_model
+        self.batch_size = batch_size
+        self.cache = cache
+
+    @property
+    def model(self):
+        # Weights are shared process-wide and only loaded on first encode.
+        return embedding_service.get_model(self.model_name)
 
-    def get_embedding(self, doc: list[str]):
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def get_embedding(
+        self,
+        doc: list[str],
+        batch_size: int | None = None,
+        as_list: bool = False,
+        use_cache: bool = True,
+    ):
         """
         Hàm này nhận vào một danh sách các chuỗi văn bản và trả về embeddings cho từng chuỗi.
+        Các chuỗi được encode theo batch thay vì từng chuỗi một.
 
         Parameters:
         doc (List[str]): Danh sách các chuỗi văn bản.
+        batch_size (int): Số chuỗi trong một batch, mặc định là self.batch_size.
+        as_list (bool): Trả về List[List[float]] như phiên bản cũ.
+        use_cache (bool): Tra cứu self.cache (nếu có) trước khi encode.
 
         Returns:
-        List[List[float]]: Danh sách các embeddings, mỗi embedding là một danh sách các giá trị float.
+        np.ndarray: Ma trận float32 liên tục (C-contiguous) kích thước (n, dim).
         """
 
         # Kiểm tra nếu doc là rỗng hoặc không phải là danh sách
         if not doc or not isinstance(doc, list):
             print('Input is not a valid list of strings.')
-            return []
+            return [] if as_list else np.empty(
+                (0, self.dimension), dtype=np.float32,
+            )
 
-        embedding = [
-            self.model.encode(
-                text.replace('###', '').replace('\n', '').replace('<br>', ''),
-            ).tolist()
-            for text in doc if text.strip()
-        ]
+        texts = [_CLEANUP_PATTERN.sub('', text) for text in doc if text.strip()]
+        if not texts:
+            return [] if as_list else np.empty(
+                (0, self.dimension), dtype=np.float32,
+            )
 
+        if use_cache and self.cache is not None:
+            embedding = self.cache.get_many(
+                texts, lambda missing: self._encode(missing, batch_size),
+            )
+        else:
+            embedding = self._encode(texts, batch_size)
+
+        if as_list:
+            return embedding.tolist()
         return embedding
 
-    def encode(self, docs: list[str]):
+    def _encode(self, texts: list[str], batch_size: int | None = None):
+        embedding = self.model.encode(
+            texts,
+            batch_size=batch_size or self.batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+        return np.ascontiguousarray(embedding, dtype=np.float32)
+
+    def encode(
+        self,
+        docs: list[str],
+        batch_size: int | None = None,
+        as_list: bool = False,
+        use_cache: bool = True,
+    ):
         try:
             embeddings = self.get_embedding(
                 doc=docs,
+                batch_size=batch_size,
+                as_list=as_list,
+                use_cache=use_cache,
             )
             return embeddings
         except Exception as e:
@@ -65,41 +124,212 @@ class Route():
         self.samples = samples
 
 
+ROUTES_EMBEDDING_PATH = os.environ.get(
+    'ROUTES_EMBEDDING_PATH',
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        '..', '..', 'Embedding', 'routesEmbedding.npy',
+    ),
+)
+
+
+def get_routes_hash(routes) -> str:
+    payload = json.dumps(
+        [[route.name, route.samples] for route in routes], ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _artifact_meta_path(path: str) -> str:
+    return os.path.splitext(path)[0] + '.meta.json'
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
 class SemanticRouter():
-    def __init__(self, embedding):
+    # mean: trung bình cosine với mọi mẫu (hành vi cũ); max: mẫu gần nhất;
+    # topk: trung bình top_k mẫu gần nhất; centroid: cosine với tâm của route.
+    MODES = ('mean', 'max', 'topk', 'centroid')
+
+    def __init__(self, embedding, routes=None, mode='mean', top_k=5):
+        if mode not in self.MODES:
+            raise ValueError(
+                f'Unknown routing mode {mode!r}, expected one of {self.MODES}',
+            )
         self.embedding = embedding
+        self.routes = routes or []
+        self.mode = mode
+        self.top_k = top_k
+
+        self._source = None
+        self._route_names = []
+        self._matrix = None
+        self._route_index = None
+        self._offsets = None
+        self._counts = None
+        self._centroids = None
+
+        if self.routes:
+            self.load_routes_embedding(self.get_embedding_route(self.routes))
 
     def get_embedding_route(self, routes):
-        routesEmbedding = {}
+        # Encode the samples of every route in one batched call, then split.
+        samples = [
+            sample for route in routes for sample in route.samples
+            if sample.strip()
+        ]
+        # Route samples are encoded once per build, keep them out of the query cache.
+        embeddings = self.embedding.encode(samples, use_cache=False)
 
+        routesEmbedding = {}
+        start = 0
         for route in routes:
-            routesEmbedding[
-                route.name
-            ] = self.embedding.encode(route.samples)
+            count = sum(1 for sample in route.samples if sample.strip())
+            routesEmbedding[route.name] = embeddings[start:start + count]
+            start += count
         return routesEmbedding
 
     def get_routes(self):
         return self.routes
 
-    def guide(self, query, routesEmbeddings):
-        queryEmbedding = self.embedding.encode([query])
-        scores = []
+    def load_routes_embedding(self, routesEmbeddings):
+        """
+        Gộp embeddings của các route thành một ma trận float32 đã chuẩn hoá,
+        các mẫu của cùng một route nằm liền nhau.
+        """
+        names, blocks = [], []
+        for route_name, route_embedding in routesEmbeddings.items():
+            block = np.asarray(route_embedding, dtype=np.float32)
+            if block.ndim != 2 or len(block) == 0:
+                continue
+            names.append(route_name)
+            blocks.append(block)
+
+        if not blocks:
+            raise ValueError('No route embeddings to load.')
 
-        # Calculate the cosine similarity of the query embedding with the sample embeddings of the router.
-        for route_name in routesEmbeddings:
-            score = np.mean(
-                cosine_similarity(
-                    queryEmbedding, routesEmbeddings[route_name],
-                ).flatten(),
+        self._set_matrix(
+            names,
+            [len(block) for block in blocks],
+            _normalize_rows(np.concatenate(blocks)),
+        )
+        self._source = routesEmbeddings
+
+    def _set_matrix(self, names, counts, matrix):
+        counts = np.asarray(counts, dtype=np.int64)
+        self._source = None
+        self._route_names = list(names)
+        # Giữ nguyên mảng memory-mapped nếu đã đúng float32/C-contiguous.
+        self._matrix = np.require(matrix, dtype=np.float32, requirements='C')
+        self._counts = counts
+        self._offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        self._route_index = np.repeat(np.arange(len(names)), counts)
+        self._centroids = _normalize_rows(
+            np.add.reduceat(self._matrix, self._offsets, axis=0)
+            / counts[:, None],
+        ).astype(np.float32)
+
+    def save_artifact(self, path, model_name, samples_hash):
+        """Ghi ma trận mẫu đã chuẩn hoá ra .npy kèm file .meta.json."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        matrix = np.ascontiguousarray(self._matrix, dtype=np.float32)
+        meta = {
+            'routes': self._route_names,
+            'counts': self._counts.tolist(),
+            'model': model_name,
+            'dimension': int(matrix.shape[1]),
+            'samples_hash': samples_hash,
+            # Lets a reader detect a .npy and .meta.json from different builds.
+            'matrix_sha256': hashlib.sha256(matrix.tobytes()).hexdigest(),
+        }
+        # Per-process temp files, each swapped in with os.replace, so workers
+        # rebuilding at the same time never read a half-written file.
+        suffix = f'.{os.getpid()}.tmp'
+        np.save(path + suffix + '.npy', matrix)
+        meta_path = _artifact_meta_path(path)
+        with open(meta_path + suffix, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        os.replace(path + suffix + '.npy', path)
+        os.replace(meta_path + suffix, meta_path)
+
+    def load_artifact(self, path, model_name=None, samples_hash=None):
+        with open(_artifact_meta_path(path), encoding='utf-8') as f:
+            meta = json.load(f)
+
+        if model_name is not None and meta['model'] != model_name:
+            raise ValueError(
+                f'Artifact was built with {meta["model"]}, expected {model_name}',
             )
-            scores.append((score, route_name))
+        if samples_hash is not None and meta['samples_hash'] != samples_hash:
+            raise ValueError('Artifact does not match the current route samples')
+
+        matrix = np.load(path, mmap_mode='r')
+        if matrix.shape != (sum(meta['counts']), meta['dimension']):
+            raise ValueError(f'Artifact shape {matrix.shape} does not match metadata')
+        if (
+            'matrix_sha256' in meta
+            and hashlib.sha256(np.ascontiguousarray(matrix).tobytes()).hexdigest()
+            != meta['matrix_sha256']
+        ):
+            raise ValueError('Artifact matrix does not match its metadata')
 
-        scores.sort(reverse=True)
-        return scores[0]
+        self._set_matrix(meta['routes'], meta['counts'], matrix)
+
+    def score(self, queries: list[str]) -> np.ndarray:
+        """Trả về ma trận điểm (len(queries), số route) theo self.mode."""
+        query_matrix = _normalize_rows(
+            np.asarray(self.embedding.encode(queries), dtype=np.float32),
+        )
+
+        if self.mode == 'centroid':
+            return query_matrix @ self._centroids.T
+
+        similarities = query_matrix @ self._matrix.T
+        if self.mode == 'mean':
+            return np.add.reduceat(
+                similarities, self._offsets, axis=1,
+            ) / self._counts
+        if self.mode == 'max':
+            return np.maximum.reduceat(similarities, self._offsets, axis=1)
+
+        scores = np.empty(
+            (len(query_matrix), len(self._route_names)), dtype=np.float32,
+        )
+        for i, (start, count) in enumerate(zip(self._offsets, self._counts)):
+            k = min(self.top_k, count)
+            segment = similarities[:, start:start + count]
+            scores[:, i] = np.partition(
+                segment, count - k, axis=1,
+            )[:, count - k:].mean(axis=1)
+        return scores
+
+    def guide_batch(self, queries: list[str], routesEmbeddings=None):
+        if routesEmbeddings is not None and routesEmbeddings is not self._source:
+            self.load_routes_embedding(routesEmbeddings)
+
+        results = [(0.0, None)] * len(queries)
+        valid = [i for i, query in enumerate(queries) if query and query.strip()]
+        if not valid:
+            return results
+
+        scores = self.score([queries[i] for i in valid])
+        best = scores.argmax(axis=1)
+        for row, i in enumerate(valid):
+            results[i] = (
+                float(scores[row, best[row]]), self._route_names[best[row]],
+            )
+        return results
+
+    def guide(self, query, routesEmbeddings=None):
+        return self.guide_batch([query], routesEmbeddings)[0]
 
 
 class ChitchatProdcutsSentimentRoute:
-    def get_semanticRouter(self):
+    def get_routes(self):
         # @title Mẫu truy vấn
         productRoute = Route(
             name='products',
@@ -389,14 +619,77 @@ class ChitchatProdcutsSentimentRoute:
             ],
         )
 
-        embedding = Embedding(os.environ['EMBEDDING_MODEL'])
+        return [productRoute, chitchatRoute]
+
+    def get_semanticRouter(
+        self,
+        embedding=None,
+        path=ROUTES_EMBEDDING_PATH,
+        rebuild=True,
+        mode='mean',
+    ):
+        """
+        Nạp router từ artifact nhị phân (memory-mapped). Nếu artifact không
+        tồn tại hoặc không khớp model/mẫu thì build lại (rebuild=True) hoặc
+        báo lỗi (rebuild=False).
+        """
+        if embedding is None:
+            embedding = Embedding(os.environ['EMBEDDING_MODEL'])
+        routes = self.get_routes()
+        samples_hash = get_routes_hash(routes)
+
+        semanticRouter = SemanticRouter(embedding, mode=mode)
+        semanticRouter.routes = routes
+        try:
+            semanticRouter.load_artifact(
+                path,
+                model_name=embedding.model_name,
+                samples_hash=samples_hash,
+            )
+            return semanticRouter
+        except (OSError, ValueError) as e:
+            if not rebuild:
+                raise
+            logger.warning(f'Rebuilding route embeddings at {path}: {e}')
 
-        semanticRouter = SemanticRouter(
-            embedding, routes=[productRoute, chitchatRoute],
+        semanticRouter.load_routes_embedding(
+            semanticRouter.get_embedding_route(routes),
+        )
+        semanticRouter.save_artifact(
+            path,
+            model_name=embedding.model_name,
+            samples_hash=samples_hash,
         )
         return semanticRouter
 
-    def get_json_routesEmbedding(self, path: str):
-        with open(path) as f:
-            routesEmbedding = json.load(f)
-        return routesEmbedding
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(
+        description='Build the binary route-embedding artifact used by SemanticRouter.',
+    )
+    parser.add_argument('--output', default=ROUTES_EMBEDDING_PATH)
+    parser.add_argument(
+        '--model',
+        default=os.environ.get('EMBEDDING_MODEL'),
+        required=os.environ.get('EMBEDDING_MODEL') is None,
+    )
+    parser.add_argument('--batch-size', type=int, default=64)
+    args = parser.parse_args()
+
+    routes = ChitchatProdcutsSentimentRoute().get_routes()
+    embedding = Embedding(args.model, batch_size=args.batch_size)
+    semanticRouter = SemanticRouter(embedding, routes=routes)
+    semanticRouter.save_artifact(
+        args.output,
+        model_name=args.model,
+        samples_hash=get_routes_hash(routes),
+    )
+    logger.info(
+        f'Saved {len(semanticRouter._matrix)} samples '
+        f'({semanticRouter._matrix.shape[1]} dims) to {args.output}',
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import os
+import sys
+import threading
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import service.LLM.PROMPT as p
+from common.logger import get_logger
+from common.text import TextProcessor
+from infrastructure.stage_executor import stage_pool
+from service.LLM.llm import LLM, LLM_ERROR_MESSAGE
+
+logger = get_logger(__name__)
+
+
+class ConversationSummarizer:
+    """
+    Giữ một bản tóm tắt ngắn (rolling summary) cho mỗi session, được cập nhật
+    nền sau mỗi câu trả lời chỉ với các tin nhắn mới kể từ lần tóm tắt trước.
+    """
+
+    def __init__(self, sessions, llm: LLM | None = None, executor=stage_pool):
+        self.sessions = sessions
+        self.llm = llm or LLM(instructions=p.model_rolling_summary_prompt())
+        self.executor = executor
+        self.text_processor = TextProcessor()
+        self._pending_lock = threading.Lock()
+
+    def get_summary(self, session_id: str | None) -> str | None:
+        return self.sessions.get(session_id).state.get("summary")
+
+    def update_async(self, session_id: str | None):
+        state = self.sessions.get(session_id).state
+        # Coalesce: messages added meanwhile are picked up by the next update.
+        with self._pending_lock:
+            if state.get("summary_pending"):
+                return
+            state["summary_pending"] = True
+        self.executor.submit(self._update, session_id)
+
+    def _update(self, session_id: str | None):
+        session = self.sessions.get(session_id)
+        state = session.state
+        try:
+            total = session.total
+            num_new = min(total - state.get("summary_upto", 0), len(session.messages))
+            if num_new <= 0:
+                return
+            new_messages = list(session.messages)[-num_new:]
+
+            summary = self.llm.get_message(
+                p.rolling_summary_prompt(
+                    state.get("summary", ""),
+                    self.text_processor.process_history(new_messages),
+                )
+            )
+            if not summary or summary == LLM_ERROR_MESSAGE:
+                # Keep the previous summary; these messages are retried next time.
+                logger.info(f"Summary update failed for session {session.id}")
+                return
+            state["summary"] = summary
+            state["summary_upto"] = total
+            self.sessions.save_summary(session.id, summary, total)
+        except Exception as e:
+            logger.info(f"Failed to update summary for session {session.id}: {e}")
+        finally:
+            with self._pending_lock:
+                state["summary_pending"] = False
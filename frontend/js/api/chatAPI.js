@@ -9,6 +9,23 @@ class ChatAPI {
         this.BASE_URL = 'http://localhost:5000';
         this.timeout = 30000; // 30 seconds timeout
         this.retryAttempts = 3;
+        this.sessionId = this.loadSessionId();
+    }
+
+    /**
+     * Get the conversation id of this browser, creating one on first visit
+     * @returns {string} Session id sent with every request
+     */
+    loadSessionId() {
+        const key = 'chat_session_id';
+        let sessionId = localStorage.getItem(key);
+        if (!sessionId) {
+            sessionId = (window.crypto && crypto.randomUUID) ?
+                crypto.randomUUID() :
+                `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+            localStorage.setItem(key, sessionId);
+        }
+        return sessionId;
     }
 
     /**
@@ -24,6 +41,7 @@ class ChatAPI {
             headers: {
                 'Content-Type': 'application/json',
                 'Accept': 'application/json',
+                'X-Session-Id': this.sessionId,
             },
             ...options
         };
@@ -129,6 +147,86 @@ class ChatAPI {
         }
     }
 
+    /**
+     * Send message and receive the answer as a stream of tokens (SSE)
+     * @param {string} message - User message
+     * @param {Function} onToken - Called with (token, fullText) for every chunk
+     * @returns {Promise<Object>} Bot response once the stream is complete
+     */
+    async streamMessage(message, onToken) {
+        try {
+            if (!message || message.trim().length === 0) {
+                throw new Error('Message cannot be empty');
+            }
+
+            const response = await fetch(`${this.BASE_URL}/stream_message`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'Accept': 'text/event-stream',
+                    'X-Session-Id': this.sessionId,
+                },
+                body: JSON.stringify({
+                    input: message.trim()
+                })
+            });
+
+            if (!response.ok || !response.body) {
+                throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+            }
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let fullText = '';
+
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) {
+                    break;
+                }
+
+                buffer += decoder.decode(value, { stream: true });
+                // SSE events are separated by a blank line
+                const events = buffer.split('\n\n');
+                buffer = events.pop();
+
+                for (const event of events) {
+                    if (!event.startsWith('data: ')) {
+                        continue;
+                    }
+                    const data = JSON.parse(event.slice(6));
+
+                    if (data.error) {
+                        throw new Error(data.error);
+                    }
+                    if (data.token) {
+                        fullText += data.token;
+                        onToken(data.token, fullText);
+                    }
+                    if (data.done) {
+                        return {
+                            success: true,
+                            message: fullText,
+                            processingTime: data.time,
+                            timestamp: Date.now() / 1000
+                        };
+                    }
+                }
+            }
+
+            throw new Error('Stream ended unexpectedly');
+
+        } catch (error) {
+            console.error('Stream message failed:', error);
+            return {
+                success: false,
+                error: error.message,
+                timestamp: Date.now() / 1000
+            };
+        }
+    }
+
     /**
      * Get chat history from server
      * @returns {Promise<Object>} Chat history
@@ -155,20 +155,41 @@ class ChatComponent {
         // Show typing indicator
         this.showTypingIndicator();
         
+        let botMessage = null;
+
         try {
-            // TODO: Gọi API để gửi tin nhắn và nhận phản hồi
-            const response = await chatAPI.sendMessage(validation.message);
+            // Render tokens as soon as they arrive
+            const response = await chatAPI.streamMessage(validation.message, (token, fullText) => {
+                if (!botMessage) {
+                    this.hideTypingIndicator();
+                    botMessage = this.addMessage('assistant', fullText);
+                } else {
+                    botMessage.content = fullText;
+                    this.updateMessage(botMessage);
+                }
+            });
             
             if (response.success) {
-                // Add bot response
-                this.addMessage('assistant', response.message, {
-                    processingTime: response.processingTime
-                });
+                if (botMessage) {
+                    botMessage.content = response.message;
+                    botMessage.processingTime = response.processingTime;
+                    this.updateMessage(botMessage);
+                } else {
+                    this.addMessage('assistant', response.message, {
+                        processingTime: response.processingTime
+                    });
+                }
                 
                 // Store conversation
                 this.saveMessagesToStorage();
                 
                 Utils.showToast('Tin nhắn đã được gửi thành công', 'success', 2000);
+            } else if (botMessage) {
+                // The stream broke off: flag the partial answer as incomplete
+                botMessage.content += '\n\n*(Câu trả lời bị gián đoạn)*';
+                botMessage.isError = true;
+                this.updateMessage(botMessage);
+                Utils.showToast(`Lỗi: ${response.error}`, 'error');
             } else {
                 // Handle error
                 this.addMessage('assistant', `Kết nối mạng không ổn định, vui lòng kiểm tra lại!`, {
@@ -223,6 +244,32 @@ class ChatComponent {
         return message;
     }
 
+    /**
+     * Re-render content of a message that is already in the chat
+     * @param {Object} message - Message object
+     */
+    updateMessage(message) {
+        const messageEl = this.chatMessages.querySelector(`[data-message-id="${message.id}"]`);
+        if (!messageEl) {
+            return;
+        }
+
+        const content = messageEl.querySelector('.message-content');
+        content.classList.toggle('error', Boolean(message.isError));
+        content.innerHTML = message.type === 'assistant' ?
+            Utils.parseMarkdown(message.content) :
+            Utils.escapeHtml(message.content);
+
+        if (message.processingTime) {
+            const time = messageEl.querySelector('.message-time');
+            time.textContent = `${Utils.formatMessageTime(message.timestamp)} • ${message.processingTime.toFixed(2)}s`;
+        }
+
+        if (this.autoScrollEnabled) {
+            this.scrollToBottom();
+        }
+    }
+
     /**
      * Render message in chat
      * @param {Object} message - Message object